@@ -0,0 +1,61 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from constants import RESPONSE_CACHE_TTL
+
+RESPONSE_CACHE_VERSION_KEY = "response-cache-version"
+
+
+def invalidate_response_cache():
+    """Сбрасывает все закешированные ответы API."""
+    cache.set(RESPONSE_CACHE_VERSION_KEY, time.time_ns(), None)
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует ответы list и retrieve для анонимных пользователей.
+
+    Ключ кеша включает полный URL запроса и метку версии, которую
+    сбрасывают сигналы из api.signals при изменении данных.
+    """
+
+    cached_actions = ("list", "retrieve")
+
+    def _get_response_cache_key(self, request):
+        version = cache.get_or_set(
+            RESPONSE_CACHE_VERSION_KEY, time.time_ns(), None
+        )
+        url_hash = hashlib.md5(
+            request.build_absolute_uri().encode(), usedforsecurity=False
+        ).hexdigest()
+        return f"response:{self.basename}:{version}:{url_hash}"
+
+    def _get_cached_response(self, handler, request, *args, **kwargs):
+        if (
+            request.user.is_authenticated
+            or self.action not in self.cached_actions
+        ):
+            return handler(request, *args, **kwargs)
+
+        cache_key = self._get_response_cache_key(request)
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data, RESPONSE_CACHE_TTL)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,60 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def user_fingerprint(user):
+    """Поля пользователя, которые попадают в ответ API."""
+    return (
+        user.pk,
+        user.username,
+        user.email,
+        user.first_name,
+        user.last_name,
+        str(user.avatar),
+    )
+
+
+def recipe_fingerprint(recipe, subscriptions):
+    """Всё, от чего зависит представление рецепта для пользователя."""
+    return (
+        recipe.pk,
+        recipe.updated_at.isoformat(),
+        getattr(recipe, "is_favorited", False),
+        getattr(recipe, "is_in_shopping_cart", False),
+        user_fingerprint(recipe.author),
+        recipe.author_id in subscriptions,
+        tuple(
+            (
+                recipe_ingredient.ingredient_id,
+                recipe_ingredient.ingredient.name,
+                recipe_ingredient.ingredient.measurement_unit,
+                recipe_ingredient.amount,
+            )
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        ),
+    )
+
+
+def conditional_response(request, fingerprint, get_data, last_modified=None):
+    """Отвечает 304 Not Modified, если ETag клиента совпадает.
+
+    get_data вызывается только при изменении данных, поэтому сериализация
+    для неизменившихся ответов не выполняется. Решение принимается по
+    ETag: Last-Modified не учитывает персональные поля (избранное,
+    корзину, подписки) и передаётся клиенту только для справки.
+    """
+    etag = quote_etag(
+        hashlib.md5(
+            repr(fingerprint).encode(), usedforsecurity=False
+        ).hexdigest()
+    )
+    response = get_conditional_response(request._request, etag=etag)
+    if response is None:
+        response = Response(get_data())
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
@@ -0,0 +1,39 @@
+import filetype
+from django.core.files.storage import default_storage
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from rest_framework import serializers
+
+
+class Base64ImageFileField(Base64FieldMixin, serializers.FileField):
+    """Изображение в Base64 без декодирования Pillow в запросе.
+
+    Тип файла определяется по сигнатуре, а полная проверка изображения
+    выполняется фоновым обработчиком вместе с построением уменьшенных копий.
+    """
+
+    ALLOWED_TYPES = Base64ImageField.ALLOWED_TYPES
+    INVALID_FILE_MESSAGE = Base64ImageField.INVALID_FILE_MESSAGE
+    INVALID_TYPE_MESSAGE = Base64ImageField.INVALID_TYPE_MESSAGE
+
+    def get_file_extension(self, filename, decoded_file):
+        extension = filetype.guess_extension(decoded_file)
+        if extension is None:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        return "jpg" if extension == "jpeg" else extension
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения."""
+
+    def to_representation(self, variants):
+        request = self.context.get("request")
+        urls = {
+            name: default_storage.url(path)
+            for name, path in variants.items()
+        }
+        if request:
+            return {
+                name: request.build_absolute_uri(url)
+                for name, url in urls.items()
+            }
+        return urls
@@ -1,4 +1,5 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter
 
 from recipes.models import Ingredient, Recipe
 
@@ -33,3 +34,23 @@ class IngredientFilter(filters.FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов с однозначным порядком для пагинации.
+
+    К выбранной сортировке добавляются -created_at и -id, как в индексах
+    модели Recipe.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(
+            super().get_ordering(request, queryset, view) or ()
+        )
+        fields = {field.lstrip("-") for field in ordering}
+        ordering.extend(
+            field
+            for field in ("-created_at", "-id")
+            if field.lstrip("-") not in fields
+        )
+        return ordering
@@ -0,0 +1,242 @@
+import json
+import math
+import re
+import statistics
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from api.cache import invalidate_response_cache
+from api.pagination import invalidate_counts
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """Процентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер задержки и числа запросов к БД для основных адресов API "
+        "с выводом результатов в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=50,
+            help="Количество замеров для каждого адреса",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=3,
+            help="Количество запросов перед замерами",
+        )
+        parser.add_argument(
+            "--base-url",
+            help=(
+                "Адрес запущенного сервера, например http://127.0.0.1:8000. "
+                "Без него запросы выполняются тестовым клиентом Django"
+            ),
+        )
+        parser.add_argument(
+            "--user",
+            help="Email пользователя, от имени которого выполняются запросы",
+        )
+        parser.add_argument(
+            "--output", help="Файл для сохранения результатов в JSON"
+        )
+
+    def _get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f"Пользователь {email} не найден.")
+            return user
+        user = (
+            User.objects.annotate(subscriptions_count=Count("follower"))
+            .order_by("-subscriptions_count", "id")
+            .first()
+        )
+        if user is None:
+            raise CommandError(
+                "В базе нет пользователей, запустите generate_fake_data."
+            )
+        return user
+
+    def _scenarios(self):
+        ingredient_name = (
+            Ingredient.objects.order_by("id")
+            .values_list("name", flat=True)
+            .first()
+            or ""
+        )
+        author_id = (
+            Recipe.objects.order_by("id")
+            .values_list("author_id", flat=True)
+            .first()
+        )
+        return [
+            ("recipes-list", "/api/recipes/", False),
+            ("recipes-list-anonymous", "/api/recipes/", True),
+            ("recipes-list-page-10", "/api/recipes/?page=10", False),
+            ("recipes-list-cursor", "/api/recipes/?cursor=", False),
+            (
+                "recipes-list-author",
+                f"/api/recipes/?author={author_id}",
+                False,
+            ),
+            ("recipes-list-favorited", "/api/recipes/?is_favorited=1", False),
+            (
+                "recipes-list-in-shopping-cart",
+                "/api/recipes/?is_in_shopping_cart=1",
+                False,
+            ),
+            (
+                "users-subscriptions",
+                "/api/users/subscriptions/?recipes_limit=3",
+                False,
+            ),
+            (
+                "download-shopping-cart",
+                "/api/recipes/download_shopping_cart/",
+                False,
+            ),
+            (
+                "ingredients-search",
+                f"/api/ingredients/?name={ingredient_name[:2]}",
+                False,
+            ),
+        ]
+
+    def _client_request(self, client, url, token):
+        headers = {} if token is None else {
+            "Authorization": f"Token {token}"
+        }
+        started_at = perf_counter()
+        response = client.get(url, headers=headers)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return (
+            perf_counter() - started_at,
+            response.status_code,
+            response.get("Server-Timing", ""),
+        )
+
+    def _http_request(self, base_url, url, token):
+        request = Request(base_url.rstrip("/") + url)
+        if token is not None:
+            request.add_header("Authorization", f"Token {token}")
+        started_at = perf_counter()
+        try:
+            with urlopen(request) as response:
+                response.read()
+                status_code = response.status
+                server_timing = response.headers.get("Server-Timing", "")
+        except HTTPError as error:
+            error.read()
+            status_code = error.code
+            server_timing = error.headers.get("Server-Timing", "")
+        return perf_counter() - started_at, status_code, server_timing
+
+    def _measure(self, send, url, token, options):
+        for _ in range(options["warmup"]):
+            send(url, token)
+        latencies, queries, statuses = [], [], set()
+        for _ in range(options["iterations"]):
+            duration, status_code, server_timing = send(url, token)
+            latencies.append(duration * 1000)
+            statuses.add(status_code)
+            match = SERVER_TIMING_QUERIES.search(server_timing)
+            if match:
+                queries.append(int(match.group(1)))
+        return {
+            "url": url,
+            "status": sorted(statuses),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "mean_ms": round(statistics.fmean(latencies), 2),
+            "queries_p50": percentile(queries, 50) if queries else None,
+            "queries_max": max(queries) if queries else None,
+        }
+
+    def _run(self, send, user, options):
+        token = Token.objects.get_or_create(user=user)[0].key
+        results = {}
+        for name, url, anonymous in self._scenarios():
+            results[name] = self._measure(
+                send, url, None if anonymous else token, options
+            )
+            self.stderr.write(
+                f"{name}: p50 {results[name]['p50_ms']} мс, "
+                f"p95 {results[name]['p95_ms']} мс"
+            )
+        return results
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("Нужен хотя бы один замер.")
+        user = self._get_user(options["user"])
+
+        if options["base_url"]:
+            results = self._run(
+                lambda url, token: self._http_request(
+                    options["base_url"], url, token
+                ),
+                user,
+                options,
+            )
+        else:
+            invalidate_response_cache()
+            invalidate_counts("recipes")
+            client = Client()
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            ):
+                results = self._run(
+                    lambda url, token: self._client_request(
+                        client, url, token
+                    ),
+                    user,
+                    options,
+                )
+
+        report = {
+            "mode": "http" if options["base_url"] else "test-client",
+            "iterations": options["iterations"],
+            "user": user.email,
+            "dataset": {
+                "users": User.objects.count(),
+                "recipes": Recipe.objects.count(),
+                "ingredients": Ingredient.objects.count(),
+                "favorites": Favorite.objects.count(),
+                "shopping_carts": ShoppingCart.objects.count(),
+                "subscriptions": Subscription.objects.count(),
+            },
+            "results": results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                file.write(output)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Результаты сохранены в {options['output']}"
+                )
+            )
+            return
+        self.stdout.write(output)
@@ -0,0 +1,126 @@
+import logging
+import time
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED_ENDPOINT = "unresolved"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление выполнило больше запросов к БД, чем разрешено."""
+
+
+class QueryCounter:
+    """Обёртка выполнения SQL, считающая запросы и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started_at
+            self.count += 1
+
+
+class RequestMetrics:
+    """Накопительные метрики запросов в разрезе представлений.
+
+    Хранятся в памяти процесса, каждый воркер отдаёт свои значения.
+    """
+
+    METRICS = (
+        ("requests_total", "Количество обработанных запросов."),
+        ("db_queries_total", "Количество запросов к базе данных."),
+        ("db_seconds_total", "Время выполнения запросов к базе данных."),
+        ("request_seconds_total", "Время обработки запросов."),
+    )
+
+    def __init__(self):
+        self._lock = Lock()
+        self._endpoints = defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    def observe(self, endpoint, queries, db_time, total_time):
+        with self._lock:
+            values = self._endpoints[endpoint]
+            values[0] += 1
+            values[1] += queries
+            values[2] += db_time
+            values[3] += total_time
+
+    def render(self):
+        """Возвращает метрики в текстовом формате Prometheus."""
+        with self._lock:
+            endpoints = sorted(
+                (endpoint, list(values))
+                for endpoint, values in self._endpoints.items()
+            )
+        lines = []
+        for index, (name, description) in enumerate(self.METRICS):
+            lines.append(f"# HELP foodgram_{name} {description}")
+            lines.append(f"# TYPE foodgram_{name} counter")
+            lines.extend(
+                f'foodgram_{name}{{endpoint="{endpoint}"}} {values[index]}'
+                for endpoint, values in endpoints
+            )
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+class QueryInstrumentationMiddleware:
+    """Замеряет запросы к БД и время ответа каждого представления.
+
+    Результаты попадают в заголовок Server-Timing и в request_metrics.
+    Если число запросов превышает QUERY_BUDGETS для метода и представления
+    (например, "GET recipes-list"), пишется предупреждение, а при
+    QUERY_BUDGET_STRICT выбрасывается QueryBudgetExceeded.
+    Запросы, выполняемые при потоковой отдаче ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        total_time = time.perf_counter() - started_at
+
+        resolver_match = request.resolver_match
+        endpoint = (
+            resolver_match.url_name or resolver_match.view_name
+            if resolver_match
+            else UNRESOLVED_ENDPOINT
+        )
+        request_metrics.observe(
+            endpoint, counter.count, counter.duration, total_time
+        )
+        response["Server-Timing"] = (
+            f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} '
+            f'queries", total;dur={total_time * 1000:.1f}'
+        )
+        self._check_budget(f"{request.method} {endpoint}", counter.count)
+        return response
+
+    def _check_budget(self, action, queries):
+        budget = settings.QUERY_BUDGETS.get(action)
+        if budget is None or queries <= budget:
+            return
+        message = (
+            f"{action}: выполнено {queries} запросов к БД "
+            f"при бюджете {budget}"
+        )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -1,11 +1,338 @@
+import hashlib
+import json
+import operator
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from functools import reduce
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import (
+    EmptyPage,
+    Page,
+    PageNotAnInteger,
+    Paginator,
+)
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from constants import (
+    PAGES_PAGINATION_COUNT_CACHE_TTL,
+    PAGES_PAGINATION_CURSOR_QUERY_PARAM,
+    PAGES_PAGINATION_ESTIMATE_THRESHOLD,
     PAGES_PAGINATION_PAGE_SIZE,
     PAGES_PAGINATION_PAGE_SIZE_QUERY_PARAM
 )
 
+COUNT_VERSION_KEY = "pagination-count-version:{basename}"
+USER_COUNT_VERSION_KEY = "pagination-count-version:{basename}:{user_id}"
+
+
+def _get_count_version(key):
+    return cache.get_or_set(key, time.time_ns(), None)
+
+
+def invalidate_counts(basename, user=None):
+    """Сбрасывает закешированные количества объектов представления.
+
+    Без user сбрасываются счётчики всех пользователей, иначе - только
+    счётчики запросов этого пользователя.
+    """
+    if user is None:
+        key = COUNT_VERSION_KEY.format(basename=basename)
+    else:
+        key = USER_COUNT_VERSION_KEY.format(
+            basename=basename, user_id=user.pk
+        )
+    cache.set(key, time.time_ns(), None)
+
+
+class KeysetPagination:
+    """Пагинация по составному ключу из полей сортировки.
+
+    Курсор хранит значения всех полей ordering у крайней записи
+    страницы, следующая страница выбирается условием
+    (created_at, id) < (значения курсора) без COUNT(*) и OFFSET,
+    поэтому время ответа не зависит от глубины страницы.
+    """
+
+    cursor_query_param = PAGES_PAGINATION_CURSOR_QUERY_PARAM
+    page_size_query_param = PAGES_PAGINATION_PAGE_SIZE_QUERY_PARAM
+    page_size = PAGES_PAGINATION_PAGE_SIZE
+    invalid_cursor_message = "Неверный курсор."
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def prepare(self, request, model):
+        """Запоминает запрос и поля модели, из которых состоит курсор."""
+        self.request = request
+        self.fields = [
+            model._meta.get_field(name.lstrip("-")) for name in self.ordering
+        ]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode()))
+            values = payload["key"]
+            if len(values) != len(self.fields):
+                raise ValueError
+            key = [
+                field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+            return key, bool(payload["reverse"])
+        except (Base64Error, DjangoValidationError, KeyError, TypeError,
+                ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse=False):
+        payload = {
+            "key": [field.value_to_string(instance) for field in self.fields],
+            "reverse": reverse,
+        }
+        return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def _after(self, key, reverse):
+        conditions, equal = [], {}
+        for name, value in zip(self.ordering, key):
+            field_name = name.lstrip("-")
+            descending = name.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            conditions.append(
+                Q(**equal, **{f"{field_name}__{lookup}": value})
+            )
+            equal[field_name] = value
+        return reduce(operator.or_, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.prepare(request, queryset.model)
+        page_size = self.get_page_size(request)
+        key, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(
+                name[1:] if name.startswith("-") else f"-{name}"
+                for name in ordering
+            )
+        queryset = queryset.order_by(*ordering)
+        if key is not None:
+            queryset = queryset.filter(self._after(key, reverse))
+
+        page = list(queryset[: page_size + 1])
+        has_more = len(page) > page_size
+        del page[page_size:]
+        if reverse:
+            page.reverse()
+            self.set_page(page, key is not None, has_more)
+        else:
+            self.set_page(page, has_more, key is not None)
+        return page
+
+    def set_page(self, page, has_next, has_previous):
+        """Запоминает страницу, выбранную по курсору."""
+        self.page = page
+        self.has_next, self.has_previous = has_next, has_previous
+
+    def get_link(self, instance, reverse):
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(instance, reverse),
+        )
+
+    def get_paginated_response(self, data):
+        next_url = previous_url = None
+        if self.page and self.has_next:
+            next_url = self.get_link(self.page[-1], reverse=False)
+        if self.page and self.has_previous:
+            previous_url = self.get_link(self.page[0], reverse=True)
+        return Response(
+            {"next": next_url, "previous": previous_url, "results": data}
+        )
+
 
 class PagesPagination(PageNumberPagination):
+    """Постраничная пагинация с режимом курсора по запросу.
+
+    Если у представления задан cursor_ordering, а в запросе передан
+    параметр cursor (в том числе пустой - для первой страницы),
+    используется KeysetPagination. Курсор работает только с сортировкой
+    cursor_ordering, другие сортировки доступны постранично.
+    """
+
     page_size_query_param = PAGES_PAGINATION_PAGE_SIZE_QUERY_PARAM
     page_size = PAGES_PAGINATION_PAGE_SIZE
+    keyset_paginator = None
+    cursor_ordering_message = (
+        "Курсорная пагинация доступна только для сортировки по умолчанию."
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_ordering = getattr(view, "cursor_ordering", None)
+        if (
+            cursor_ordering
+            and PAGES_PAGINATION_CURSOR_QUERY_PARAM in request.query_params
+        ):
+            ordering = tuple(queryset.query.order_by)
+            if ordering and ordering != tuple(cursor_ordering):
+                raise ValidationError(
+                    {"detail": [self.cursor_ordering_message]}
+                )
+            self.keyset_paginator = KeysetPagination(cursor_ordering)
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class CachedCountPage(Page):
+    """Страница, которая знает о следующей странице без точного COUNT(*)."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор, который не пересчитывает COUNT(*) на каждый запрос.
+
+    Закешированное или оценочное количество только показывается
+    клиенту. Границы страницы от него не зависят: выбирается на одну
+    запись больше размера страницы, по ней определяется наличие
+    следующей страницы.
+    """
+
+    cache_key = None
+
+    def _estimate_count(self):
+        queryset = self.object_list
+        if queryset.query.where:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= PAGES_PAGINATION_ESTIMATE_THRESHOLD:
+            return row[0]
+        return None
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate_count()
+        if estimate is not None:
+            return estimate
+        if self.cache_key is None:
+            return super().count
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = super().count
+            cache.set(
+                self.cache_key, count, PAGES_PAGINATION_COUNT_CACHE_TTL
+            )
+        return count
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("Номер страницы не является числом.")
+        if number < 1:
+            raise EmptyPage("Номер страницы меньше 1.")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(
+            self.object_list[bottom:bottom + self.per_page + 1]
+        )
+        if not object_list and number > 1:
+            raise EmptyPage("На этой странице нет результатов.")
+        has_next = len(object_list) > self.per_page
+        del object_list[self.per_page:]
+        # Выбранная страница точнее приблизительного количества.
+        seen = bottom + len(object_list)
+        if not has_next:
+            self.count = seen
+        elif self.count <= seen:
+            self.count = seen + 1
+        return CachedCountPage(object_list, number, self, has_next)
+
+
+class CachedCountPagination(PagesPagination):
+    """Пагинация с кешированием количества объектов.
+
+    Количество кешируется для набора параметров запроса и пользователя
+    на PAGES_PAGINATION_COUNT_CACHE_TTL секунд. Представление сбрасывает
+    его через invalidate_counts при создании и удалении объектов.
+    Для больших таблиц без фильтров в PostgreSQL берётся оценка из
+    pg_class.reltuples.
+    """
+
+    count_cache_key = None
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = CachedCountPaginator(object_list, per_page)
+        paginator.cache_key = self.count_cache_key
+        return paginator
+
+    def get_count_cache_key(self, request, view):
+        basename = getattr(view, "basename", None)
+        if basename is None:
+            return None
+        user_id = request.user.pk
+        action = getattr(view, "action", None)
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            if key not in (self.page_query_param, self.page_size_query_param)
+            for value in values
+        )
+        params_hash = hashlib.md5(
+            repr(params).encode(), usedforsecurity=False
+        ).hexdigest()
+        version = _get_count_version(
+            COUNT_VERSION_KEY.format(basename=basename)
+        )
+        user_version = _get_count_version(
+            USER_COUNT_VERSION_KEY.format(basename=basename, user_id=user_id)
+        )
+        return (
+            f"pagination-count:{basename}:{action}:{version}:"
+            f"{user_id}:{user_version}:{params_hash}"
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_cache_key = self.get_count_cache_key(request, view)
+        return super().paginate_queryset(queryset, request, view)
@@ -1,17 +1,20 @@
-from django.core.exceptions import ValidationError
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
 from rest_framework import serializers
 
-from constants import RECIPE_INGREDIENT_MIN_AMOUNT, RECIPE_MIN_LIMIT
+from constants import RECIPE_INGREDIENT_MIN_AMOUNT
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingCartTotal,
 )
+from recipes.images import schedule_recipe_image_processing
 from users.models import Subscription
+from .fields import Base64ImageFileField, ImageVariantsField
 
 
 class UserSerializer(BaseUserSerializer):
@@ -31,10 +34,15 @@ class UserSerializer(BaseUserSerializer):
 
     def get_is_subscribed(self, user):
         request_user = self.context["request"].user
-        return (
-            request_user.is_authenticated
-            and user.author.filter(follower=request_user).exists()
-        )
+        if not request_user.is_authenticated:
+            return False
+        subscriptions = self.context.get("subscriptions")
+        if subscriptions is None:
+            subscriptions = set(
+                request_user.follower.values_list("author_id", flat=True)
+            )
+            self.context["subscriptions"] = subscriptions
+        return user.id in subscriptions
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -81,7 +89,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     Сериализатор для создания и обновления рецептов
     """
     ingredients = RecipeIngredientWriteSerializer(many=True)
-    image = Base64ImageField()
+    image = Base64ImageFileField()
 
     class Meta:
         model = Recipe
@@ -107,7 +115,9 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 {"detail": 'Поле "ingredients" должно быть списком.'}
             )
 
-        ingredient_ids = [ingredient["id"] for ingredient in ingredients]
+        ingredient_ids = [
+            ingredient["ingredient"].id for ingredient in ingredients
+        ]
         if len(set(ingredient_ids)) != len(ingredient_ids):
             raise serializers.ValidationError(
                 {"detail": "Ингредиенты не могут повторяться."}
@@ -127,24 +137,50 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         validated_data["author"] = self.context.get("request").user
         recipe = super().create(validated_data)
         self._save_ingredients(recipe, ingredients_data)
+        schedule_recipe_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredients")
+        deltas = {
+            ingredient["ingredient"].id: ingredient["amount"]
+            for ingredient in ingredients_data
+        }
+        for ingredient_id, amount in instance.recipe_ingredients.values_list(
+            "ingredient_id", "amount"
+        ):
+            deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
         instance.ingredients.clear()
         self._save_ingredients(instance, ingredients_data)
-        return super().update(instance, validated_data)
+        ShoppingCartTotal.objects.apply_deltas(
+            instance.shoppingcarts.values_list("user_id", flat=True), deltas
+        )
+        if "image" not in validated_data:
+            return super().update(instance, validated_data)
+
+        stale_image = instance.image.name
+        stale_variants = list(instance.image_variants.values())
+        validated_data["image_variants"] = {}
+        instance = super().update(instance, validated_data)
+        schedule_recipe_image_processing(
+            instance, stale_image, stale_variants
+        )
+        return instance
 
     def _save_ingredients(self, recipe, ingredients_data):
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
-                ingredient_id=ingredient["id"],
+                ingredient=ingredient["ingredient"],
                 amount=ingredient["amount"],
             )
             for ingredient in ingredients_data
         )
 
+    def to_representation(self, instance):
+        return RecipeReadSerializer(instance, context=self.context).data
+
 
 class RecipeReadSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
@@ -154,6 +190,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -162,6 +199,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "name",
             "text",
             "image",
+            "image_variants",
             "author",
             "cooking_time",
             "ingredients",
@@ -169,31 +207,33 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
         )
 
-    def _check_existence(self, model, recipe):
+    def _check_existence(self, model, recipe, annotation):
         request = self.context.get("request")
         if not request or not request.user.is_authenticated:
             return False
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
         return model.objects.filter(user=request.user, recipe=recipe).exists()
 
     def get_is_favorited(self, recipe):
-        return self._check_existence(Favorite, recipe)
+        return self._check_existence(Favorite, recipe, "is_favorited")
 
     def get_is_in_shopping_cart(self, recipe):
-        return self._check_existence(ShoppingCart, recipe)
+        return self._check_existence(
+            ShoppingCart, recipe, "is_in_shopping_cart"
+        )
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
 
 
 class SubscribedUserSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(
-        source="recipes.count",
-        read_only=True,
-    )
 
     class Meta(UserSerializer.Meta):
         fields = (
@@ -203,34 +243,11 @@ class SubscribedUserSerializer(UserSerializer):
         )
 
     def get_recipes(self, author):
-        request = self.context.get("request")
-        recipes_limit = request.GET.get("recipes_limit")
-        recipes = author.recipes.all()
-        if recipes_limit:
-            try:
-                recipes_limit = int(recipes_limit)
-            except ValueError:
-                raise ValidationError(
-                    {
-                        "detail": (
-                            'Параметр "recipes_limit" должен быть '
-                            "целым числом."
-                        )
-                    }
-                )
-
-            if recipes_limit < RECIPE_MIN_LIMIT:
-                raise ValidationError(
-                    {
-                        "detail": (
-                            f'Параметр "recipes_limit" должен быть '
-                            f"не менее {RECIPE_MIN_LIMIT}."
-                        )
-                    }
-                )
-
-            recipes = author.recipes.all()[:recipes_limit]
-
+        recipes = getattr(author, "recipes_preview", None)
+        if recipes is None:
+            recipes = author.recipes.all()[
+                :self.context.get("recipes_limit")
+            ]
         return ShortRecipeSerializer(recipes, many=True).data
 
 
@@ -238,29 +255,21 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subscription
         fields = ("follower", "author")
-        read_only_fields = ("follower",)
-
-    def validate(self, data):
-        if not data.get("author"):
-            raise serializers.ValidationError(
-                {"detail": 'Поле "author" не может быть пустым.'}
-            )
+        read_only_fields = ("follower", "author")
 
-        request = self.context.get("request")
-        author = data["author"]
-        if author == request.user:
+    def create(self, validated_data):
+        if validated_data["author"] == validated_data["follower"]:
             raise serializers.ValidationError(
-                {"detail": "Нельзя подписаться на самого себя."}
+                {"detail": ["Нельзя подписаться на самого себя."]}
             )
-
-        if Subscription.objects.filter(
-            follower=request.user, author=author
-        ).exists():
+        subscription = Subscription.objects.create_or_ignore(
+            **validated_data
+        )
+        if subscription is None:
             raise serializers.ValidationError(
-                {"detail": "Подписка уже оформлена."}
+                {"detail": ["Подписка уже оформлена."]}
             )
-
-        return data
+        return subscription
 
     def to_representation(self, instance):
         data = SubscribedUserSerializer(
@@ -276,22 +285,15 @@ class BaseUserRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         abstract = True
         fields = ("user", "recipe")
-        read_only_fields = ("user",)
-
-    def validate(self, data):
-        if not data.get("recipe"):
-            raise serializers.ValidationError(
-                {"detail": 'Поле "recipe" не может быть пустым.'}
-            )
+        read_only_fields = ("user", "recipe")
 
-        user = self.context["request"].user
-        recipe = data["recipe"]
-
-        if self.Meta.model.objects.filter(user=user, recipe=recipe).exists():
+    def create(self, validated_data):
+        instance = self.Meta.model.objects.create_or_ignore(**validated_data)
+        if instance is None:
             raise serializers.ValidationError(
-                {"detail": self.duplicate_error_message}
+                {"detail": [self.duplicate_error_message]}
             )
-        return data
+        return instance
 
     def to_representation(self, instance):
         return ShortRecipeSerializer(
@@ -311,3 +313,11 @@ class ShoppingCartSerializer(BaseUserRecipeSerializer):
 
     class Meta(BaseUserRecipeSerializer.Meta):
         model = ShoppingCart
+
+    @transaction.atomic
+    def create(self, validated_data):
+        instance = super().create(validated_data)
+        ShoppingCartTotal.objects.add_recipe(
+            instance.recipe, [instance.user_id]
+        )
+        return instance
@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from users.models import User
+from .cache import invalidate_response_cache
+
+USER_PUBLIC_FIELDS = frozenset(
+    ("username", "email", "first_name", "last_name", "avatar")
+)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipes_response_cache(sender, **kwargs):
+    """Сбрасывает кеш ответов при изменении рецептов.
+
+    Версия сбрасывается после фиксации транзакции: иначе параллельный
+    запрос может прочитать ещё не зафиксированные данные и закешировать
+    их под новой версией на RESPONSE_CACHE_TTL.
+    """
+    transaction.on_commit(invalidate_response_cache)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_users_response_cache(sender, update_fields=None, **kwargs):
+    """Сбрасывает кеш ответов при изменении публичных данных автора."""
+    if update_fields and not USER_PUBLIC_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(invalidate_response_cache)
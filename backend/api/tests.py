@@ -0,0 +1,158 @@
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Ingredient, Recipe, RecipeIngredient
+from users.models import Subscription, User
+
+
+class RecipeListQueryCountTest(TestCase):
+    """Число запросов к БД в списке рецептов не зависит от размера
+    страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = User.objects.bulk_create(
+            User(
+                username=f"author{number}",
+                email=f"author{number}@example.com",
+                first_name="Автор",
+                last_name=str(number),
+            )
+            for number in range(10)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Продукт {number}", measurement_unit="г")
+            for number in range(5)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=authors[number % len(authors)],
+                name=f"Рецепт {number}",
+                text="Описание",
+                image="recipes/images/test.png",
+                cooking_time=10,
+            )
+            for number in range(100)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in ingredients
+        )
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+
+    def setUp(self):
+        self.anonymous_client = APIClient()
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def assert_list_queries(self, client, limit, queries):
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = client.get("/api/recipes/", {"limit": limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), limit)
+
+    def test_anonymous_list(self):
+        for limit in (6, 50):
+            with self.subTest(limit=limit):
+                self.assert_list_queries(self.anonymous_client, limit, 3)
+
+    def test_authenticated_list(self):
+        for limit in (6, 50):
+            with self.subTest(limit=limit):
+                self.assert_list_queries(self.user_client, limit, 4)
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "EXPLAIN проверяется в PostgreSQL"
+)
+class QueryPlanTest(TestCase):
+    """Основные запросы API читают данные по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(
+                username=f"user{number}",
+                email=f"user{number}@example.com",
+                first_name="Пользователь",
+                last_name=str(number),
+            )
+            for number in range(200)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=users[number % len(users)],
+                name=f"Рецепт {number}",
+                text="Описание",
+                image="recipes/images/test.png",
+                cooking_time=10,
+            )
+            for number in range(5000)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=recipes[(index * 7 + step) % 5000])
+            for index, user in enumerate(users)
+            for step in range(20)
+        )
+        Subscription.objects.bulk_create(
+            Subscription(follower=user, author=users[(index + step) % 200])
+            for index, user in enumerate(users)
+            for step in range(1, 11)
+        )
+        cls.user, cls.author = users[0], users[1]
+        with connection.cursor() as cursor:
+            for model in (Recipe, Favorite, Subscription, User):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+    def setUp(self):
+        # На тестовом объёме данных планировщик может предпочесть
+        # последовательное чтение, проверяется именно пригодность индекса.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assert_uses_index(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_recipe_feed(self):
+        self.assert_uses_index(
+            Recipe.objects.order_by("-created_at", "-id")[:6],
+            "recipe_created_idx",
+        )
+
+    def test_author_filter(self):
+        self.assert_uses_index(
+            Recipe.objects.filter(author=self.author).order_by(
+                "-created_at", "-id"
+            )[:6],
+            "recipe_author_created_idx",
+        )
+
+    def test_is_favorited_filter(self):
+        self.assert_uses_index(
+            Recipe.objects.filter(favorites__user=self.user),
+            "recipes_favorite_unique_user_recipe",
+        )
+
+    def test_subscriptions(self):
+        self.assert_uses_index(
+            User.objects.filter(author__follower=self.user),
+            "unique_subscription",
+        )
+
+    def test_author_followers(self):
+        self.assert_uses_index(
+            Subscription.objects.filter(author=self.author).values(
+                "follower_id"
+            ),
+            "subscription_author_idx",
+        )
@@ -1,7 +1,12 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, UserViewSet
+from .views import (
+    IngredientViewSet,
+    MetricsView,
+    RecipeViewSet,
+    UserViewSet
+)
 
 
 router = DefaultRouter()
@@ -17,4 +22,5 @@ urlpatterns = [
         RecipeViewSet.as_view({"get": "get_link"}),
         name="recipe-short-link",
     ),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
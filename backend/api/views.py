@@ -1,19 +1,35 @@
-from django.db.models import F, Sum
-from django.http import HttpResponse
+import csv
+import json
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django_filters.rest_framework import (
     DjangoFilterBackend,
 )
 from djoser.views import UserViewSet as BaseUserViewSet
-from rest_framework import status, viewsets
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import (
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly
 )
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-
+from rest_framework.views import APIView
+
+from constants import RECIPE_MIN_LIMIT
+from recipes.feed import (
+    backfill_feed,
+    get_feed_page,
+    prune_feed,
+    schedule_feed_fan_out
+)
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -21,20 +37,42 @@ from recipes.models import (
     RecipeIngredient,
     ShoppingCart,
 )
+from recipes.search import search_ingredients
 from users.models import Subscription, User
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import PagesPagination
+from .cache import AnonymousResponseCacheMixin
+from .conditional import (
+    conditional_response,
+    recipe_fingerprint,
+    user_fingerprint
+)
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
+from .middleware import request_metrics
+from .pagination import (
+    CachedCountPagination,
+    KeysetPagination,
+    PagesPagination,
+    invalidate_counts
+)
 from .permissions import IsAuthorOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
 from .serializers import (FavoriteSerializer, IngredientSerializer,
                           RecipeReadSerializer, RecipeWriteSerializer,
                           ShoppingCartSerializer, SubscribedUserSerializer,
                           SubscriptionSerializer, UserSerializer)
 
 
+class Echo:
+    """Псевдобуфер для потоковой записи CSV."""
+
+    def write(self, value):
+        return value
+
+
 class UserViewSet(BaseUserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = PagesPagination
+    cursor_ordering = ("username", "id")
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     @action(
@@ -44,7 +82,11 @@ class UserViewSet(BaseUserViewSet):
         permission_classes=[IsAuthenticated],
     )
     def get_me(self, request):
-        return Response(self.get_serializer(request.user).data)
+        return conditional_response(
+            request,
+            user_fingerprint(request.user),
+            lambda: self.get_serializer(request.user).data,
+        )
 
     @action(detail=False, methods=["put", "delete"], url_path="me/avatar")
     def change_avatar(self, request):
@@ -64,8 +106,8 @@ class UserViewSet(BaseUserViewSet):
                 {"avatar": serializer.data["avatar"]},
                 status=status.HTTP_200_OK,
             )
-        user.avatar.delete()
-        user.save()
+        user.avatar = None
+        user.save(update_fields=["avatar"])
         return Response(
             {"message": "Аватар успешно удален"},
             status=status.HTTP_204_NO_CONTENT,
@@ -76,33 +118,89 @@ class UserViewSet(BaseUserViewSet):
         author = get_object_or_404(User, pk=id)
         if request.method == "POST":
             serializer = SubscriptionSerializer(
-                data={"author": author.id}, context={"request": request}
+                data={},
+                context={
+                    "request": request,
+                    "recipes_limit": self._get_recipes_limit(request),
+                },
             )
             serializer.is_valid(raise_exception=True)
-            subscription = serializer.save(follower=request.user)
+            with transaction.atomic():
+                subscription = serializer.save(
+                    follower=request.user, author=author
+                )
+                User.objects.filter(pk=author.pk).update(
+                    followers_count=F("followers_count") + 1
+                )
+                backfill_feed(request.user, author)
             return Response(
                 serializer.to_representation(subscription),
                 status=status.HTTP_201_CREATED,
             )
 
-        subscription = Subscription.objects.filter(
-            follower=request.user, author=author
-        ).first()
-        if not subscription:
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                follower=request.user, author=author
+            ).delete()
+            if deleted:
+                User.objects.filter(
+                    pk=author.pk, followers_count__gt=0
+                ).update(followers_count=F("followers_count") - 1)
+                prune_feed(request.user, author)
+        if not deleted:
             return Response(
                 {"detail": "Подписка не существует."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-
-        subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def _get_recipes_limit(request):
+        recipes_limit = request.query_params.get("recipes_limit")
+        if not recipes_limit:
+            return None
+
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            raise serializers.ValidationError(
+                {
+                    "detail": (
+                        'Параметр "recipes_limit" должен быть '
+                        "целым числом."
+                    )
+                }
+            )
+
+        if recipes_limit < RECIPE_MIN_LIMIT:
+            raise serializers.ValidationError(
+                {
+                    "detail": (
+                        f'Параметр "recipes_limit" должен быть '
+                        f"не менее {RECIPE_MIN_LIMIT}."
+                    )
+                }
+            )
+        return recipes_limit
+
     @action(detail=False, methods=["get"], url_path="subscriptions")
     def subscriptions(self, request):
-        subscriptions = User.objects.filter(author__follower=request.user)
+        recipes_limit = self._get_recipes_limit(request)
+        subscriptions = (
+            User.objects.filter(author__follower=request.user)
+            .prefetch_related(
+                Prefetch(
+                    "recipes",
+                    queryset=Recipe.objects.all()[:recipes_limit],
+                    to_attr="recipes_preview",
+                )
+            )
+        )
         paginated_subscriptions = self.paginate_queryset(subscriptions)
         serializer = SubscribedUserSerializer(
-            paginated_subscriptions, many=True, context={"request": request}
+            paginated_subscriptions,
+            many=True,
+            context={"request": request, "recipes_limit": recipes_limit},
         )
         return self.get_paginated_response(serializer.data)
 
@@ -118,51 +216,215 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if not name:
+            return super().list(request, *args, **kwargs)
+
+        limit = request.query_params.get("limit")
+        if limit and not limit.isdigit():
+            raise serializers.ValidationError(
+                {"detail": 'Параметр "limit" должен быть целым числом.'}
+            )
+        ingredients = search_ingredients(name, int(limit) if limit else None)
+        return Response(self.get_serializer(ingredients, many=True).data)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.select_related("author").prefetch_related(
+        Prefetch(
+            "recipe_ingredients",
+            queryset=RecipeIngredient.objects.select_related("ingredient"),
+        )
+    )
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    pagination_class = PagesPagination
-    filter_backends = [DjangoFilterBackend]
+    pagination_class = CachedCountPagination
+    cursor_ordering = ("-created_at", "-id")
+    filter_backends = [DjangoFilterBackend, RecipeOrderingFilter]
     filterset_class = RecipeFilter
+    ordering_fields = ("created_at", "favorites_count")
+    ordering = cursor_ordering
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
 
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
+    def _get_subscriptions(self):
+        if not hasattr(self, "_subscriptions"):
+            self._subscriptions = set(
+                self.request.user.follower.values_list(
+                    "author_id", flat=True
+                )
+            )
+        return self._subscriptions
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated:
+            context["subscriptions"] = self._get_subscriptions()
+        return context
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        subscriptions = self._get_subscriptions()
+        return conditional_response(
+            request,
+            (
+                self.get_paginated_response([]).data,
+                [recipe_fingerprint(recipe, subscriptions) for recipe in page],
+            ),
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data
+            ).data,
+            max((recipe.updated_at for recipe in page), default=None),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+
+        recipe = self.get_object()
+        return conditional_response(
+            request,
+            recipe_fingerprint(recipe, self._get_subscriptions()),
+            lambda: self.get_serializer(recipe).data,
+            recipe.updated_at,
+        )
+
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        schedule_feed_fan_out(recipe)
+        User.objects.filter(pk=self.request.user.pk).update(
+            recipes_count=F("recipes_count") + 1
+        )
+        # Сброс после фиксации, иначе параллельный запрос успеет закешировать
+        # старое количество под новой версией ключа.
+        transaction.on_commit(lambda: invalidate_counts(self.basename))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        User.objects.filter(
+            pk=instance.author_id, recipes_count__gt=0
+        ).update(recipes_count=F("recipes_count") - 1)
+        transaction.on_commit(lambda: invalidate_counts(self.basename))
 
     def _toggle_favorite_or_shopping_cart(self, request, recipe, model):
-        serializer_class = (
-            FavoriteSerializer if model == Favorite else ShoppingCartSerializer
-        )
+        if model == Favorite:
+            serializer_class = FavoriteSerializer
+            counter = "favorites_count"
+        else:
+            serializer_class = ShoppingCartSerializer
+            counter = "in_carts_count"
+        recipes = Recipe.objects.filter(pk=recipe.pk)
 
         if request.method == "POST":
             serializer = serializer_class(
-                data={"recipe": recipe.id}, context={"request": request}
+                data={}, context={"request": request}
             )
             serializer.is_valid(raise_exception=True)
-            instance = serializer.save(user=request.user)
+            with transaction.atomic():
+                instance = serializer.save(user=request.user, recipe=recipe)
+                recipes.update(**{counter: F(counter) + 1})
+            invalidate_counts(self.basename, request.user)
             return Response(
                 serializer.to_representation(instance),
                 status=status.HTTP_201_CREATED,
             )
 
-        instance_item = model.objects.filter(
-            user=request.user, recipe=recipe
-        ).first()
-
-        if not instance_item:
+        # Удаление без предварительного поиска записи: счётчик меняется,
+        # только если запись действительно была удалена. Сводную корзину
+        # обновляет обработчик pre_delete у ShoppingCart.
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=request.user, recipe=recipe
+            ).delete()
+            if deleted:
+                recipes.filter(**{f"{counter}__gt": 0}).update(
+                    **{counter: F(counter) - 1}
+                )
+        if not deleted:
             return Response(
                 {"detail": "Рецепт отсутствует"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-
-        instance_item.delete()
+        invalidate_counts(self.basename, request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="trending",
+        filter_backends=[DjangoFilterBackend],
+        pagination_class=PagesPagination,
+        cursor_ordering=None,
+    )
+    def trending(self, request):
+        """Популярные рецепты по рейтингу из RecipeScore.
+
+        Рейтинг заранее считает команда compute_recipe_scores, поэтому
+        страница читается по индексу recipe_score_idx. Количество не
+        кешируется: команда пересчитывает рейтинг вне API и не сбрасывает
+        кеш количеств.
+        """
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .filter(score__isnull=False)
+            .order_by("-score__score", "-score__recipe_id")
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="feed",
+        permission_classes=[IsAuthenticated],
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        paginator = KeysetPagination(self.cursor_ordering)
+        paginator.prepare(request, Recipe)
+        position, reverse = paginator.decode_cursor(request)
+        if reverse:
+            # Лента листается только вперёд.
+            raise NotFound(paginator.invalid_cursor_message)
+        keys, has_next = get_feed_page(
+            request.user, paginator.get_page_size(request), position
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in keys]
+        )
+        page = [
+            recipes[recipe_id] for _, recipe_id in keys if recipe_id in recipes
+        ]
+        paginator.set_page(page, has_next, has_previous=False)
+        return paginator.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
     @action(
         detail=True,
         methods=["post", "delete"],
@@ -188,64 +450,130 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
     @staticmethod
-    def _prepare_text(request, ingredients):
+    def _stream_txt(ingredients, recipe_names):
         today = timezone.now().strftime("%d.%m.%Y")
-        report_lines = [
-            f"Список покупок на {today}:",
-            "Продукты:",
-        ]
+        yield f"Список покупок на {today}:\nПродукты:\n"
 
         for idx, item in enumerate(ingredients, start=1):
             name = item["ingredient_name"].capitalize()
             unit = item["measurement_unit"]
             amount = item["total_amount"]
-            report_lines.append(f"{idx}. {name} ({unit}) - {amount}")
+            yield f"{idx}. {name} ({unit}) - {amount}\n"
 
-        recipe_names = (
-            request.user.shoppingcarts.values_list("recipe__name", flat=True)
-            .distinct()
-            .order_by("recipe__name")
-        )
-        report_lines.append("\nРецепты, для которых нужны эти продукты:")
+        yield "\nРецепты, для которых нужны эти продукты:\n"
         for idx, recipe in enumerate(recipe_names, start=1):
-            report_lines.append(f"{idx}. {recipe}")
+            yield f"{idx}. {recipe}\n"
+
+    @staticmethod
+    def _stream_csv(ingredients, recipe_names):
+        buffer = Echo()
+        writer = csv.writer(buffer)
+        yield writer.writerow(("name", "measurement_unit", "amount"))
+        for item in ingredients:
+            yield writer.writerow(
+                (
+                    item["ingredient_name"],
+                    item["measurement_unit"],
+                    item["total_amount"],
+                )
+            )
 
-        return "\n".join(report_lines)
+    @staticmethod
+    def _stream_json(ingredients, recipe_names):
+        today = timezone.now().date().isoformat()
+        yield f'{{"date": "{today}", "ingredients": ['
+        for idx, item in enumerate(ingredients):
+            yield ("," if idx else "") + json.dumps(
+                {
+                    "name": item["ingredient_name"],
+                    "measurement_unit": item["measurement_unit"],
+                    "amount": item["total_amount"],
+                },
+                ensure_ascii=False,
+            )
+        yield '], "recipes": ['
+        for idx, recipe in enumerate(recipe_names):
+            yield ("," if idx else "") + json.dumps(
+                recipe, ensure_ascii=False
+            )
+        yield "]}"
 
     @action(
         detail=False,
         methods=["get"],
         url_path="download_shopping_cart",
         permission_classes=[IsAuthenticated],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
     )
     def download_shopping_cart(self, request):
-        ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__shoppingcarts__user=request.user
+        if not request.user.shoppingcarts.exists():
+            return Response(
+                {"detail": "Корзина пуста"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            .values(
+
+        ingredients = (
+            request.user.shopping_cart_totals.values(
+                "total_amount",
                 ingredient_name=F("ingredient__name"),
                 measurement_unit=F("ingredient__measurement_unit"),
             )
-            .annotate(total_amount=Sum("amount"))
             .order_by("ingredient__name")
+            .iterator()
         )
-
-        if not ingredients.exists():
-            return Response(
-                {"detail": "Корзина пуста"},
-                status=status.HTTP_400_BAD_REQUEST
+        first_item = next(ingredients, None)
+        if first_item is None:
+            # Сводная корзина расходится с корзиной, считаем по рецептам.
+            ingredients = (
+                RecipeIngredient.objects.filter(
+                    recipe__shoppingcarts__user=request.user
+                )
+                .values(
+                    ingredient_name=F("ingredient__name"),
+                    measurement_unit=F("ingredient__measurement_unit"),
+                )
+                .annotate(total_amount=Sum("amount"))
+                .order_by("ingredient_name")
+                .iterator()
             )
+            first_item = next(ingredients, None)
+            if first_item is None:
+                return Response(
+                    {"detail": "Корзина пуста"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        report_text = self._prepare_text(request, ingredients)
-        response = HttpResponse(
-            report_text, content_type="text/plain; charset=utf-8"
+        recipe_names = (
+            request.user.shoppingcarts.values_list("recipe__name", flat=True)
+            .distinct()
+            .order_by("recipe__name")
+            .iterator()
+        )
+        export_format = request.accepted_renderer.format
+        stream = getattr(self, f"_stream_{export_format}")
+        response = StreamingHttpResponse(
+            stream(chain((first_item,), ingredients), recipe_names),
+            content_type=(
+                f"{request.accepted_renderer.media_type}; charset=utf-8"
+            ),
         )
         response["Content-Disposition"] = (
-            "attachment; " 'filename="shopping_cart.txt"'
+            f'attachment; filename="shopping_cart.{export_format}"'
         )
         return response
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Текстовые рендереры нужны только для самого файла списка
+        # покупок, ошибки отдаются в JSON, как и в остальном API.
+        if (
+            self.action == "download_shopping_cart"
+            and isinstance(response, Response)
+            and response.status_code >= status.HTTP_400_BAD_REQUEST
+        ):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
     @action(detail=True, methods=["get"], url_path="get-link")
     def get_link(self, request, pk=None):
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -254,3 +582,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         short_link = f"{domain}/recipes/{recipe.id}"
         return Response({"short-link": short_link})
+
+
+class MetricsView(APIView):
+    """Метрики запросов в текстовом формате Prometheus."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            request_metrics.render(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
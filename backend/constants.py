@@ -11,3 +11,26 @@ RECIPE_INGREDIENT_MIN_AMOUNT = 1
 RECIPE_MIN_LIMIT = 1
 PAGES_PAGINATION_PAGE_SIZE_QUERY_PARAM = "limit"
 PAGES_PAGINATION_PAGE_SIZE = 6
+PAGES_PAGINATION_CURSOR_QUERY_PARAM = "cursor"
+PAGES_PAGINATION_COUNT_CACHE_TTL = 60
+PAGES_PAGINATION_ESTIMATE_THRESHOLD = 100_000
+INGREDIENT_INDEX_TTL = 300
+RESPONSE_CACHE_TTL = 300
+IMAGE_PROCESSING_WORKERS = 2
+IMAGE_VARIANTS = {
+    "thumbnail": (320, "JPEG", "jpg"),
+    "medium": (960, "JPEG", "jpg"),
+    "webp": (960, "WEBP", "webp"),
+}
+PENDING_FILE_DELETION_MAX_LENGTH = 255
+MEDIA_DELETION_GRACE_PERIOD = 600
+TRENDING_WINDOW_DAYS = 14
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_SHOPPING_CART_WEIGHT = 0.5
+FEED_FANOUT_WORKERS = 2
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_FANOUT_MAX_FOLLOWERS = 10_000
+FEED_BACKFILL_SIZE = 50
+FEED_REBUILD_BATCH_SIZE = 1000
+SHOPPING_CART_UPSERT_BATCH_SIZE = 1000
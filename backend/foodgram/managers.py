@@ -0,0 +1,62 @@
+from django.db import connections, models, router
+from django.db.models.signals import post_save, pre_save
+
+
+class InsertIgnoreManager(models.Manager):
+    """Менеджер с атомарной вставкой без ошибки на дубликат."""
+
+    def create_or_ignore(self, **fields):
+        """Создаёт запись через INSERT ... ON CONFLICT DO NOTHING.
+
+        Возвращает созданный объект или None, если запись нарушила бы
+        уникальное ограничение. В отличие от перехвата IntegrityError
+        дубликат не вызывает ошибки на стороне базы данных. Сигналы
+        pre_save и post_save отправляются так же, как при save().
+        """
+        instance = self.model(**fields)
+        meta = self.model._meta
+        using = self._db or router.db_for_write(self.model, instance=instance)
+        pre_save.send(
+            sender=self.model,
+            instance=instance,
+            raw=False,
+            using=using,
+            update_fields=None,
+        )
+        connection = connections[using]
+        quote_name = connection.ops.quote_name
+        insert_fields = [
+            field
+            for field in meta.local_concrete_fields
+            if not field.primary_key
+        ]
+        values = [
+            field.get_db_prep_save(
+                field.pre_save(instance, add=True), connection
+            )
+            for field in insert_fields
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote_name(meta.db_table)} "
+                f"({', '.join(quote_name(f.column) for f in insert_fields)}) "
+                f"VALUES ({', '.join(['%s'] * len(values))}) "
+                f"ON CONFLICT DO NOTHING "
+                f"RETURNING {quote_name(meta.pk.column)}",
+                values,
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        instance.pk = row[0]
+        instance._state.adding = False
+        instance._state.db = using
+        post_save.send(
+            sender=self.model,
+            instance=instance,
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=using,
+        )
+        return instance
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.QueryInstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -112,6 +113,26 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "data", "images")
 os.makedirs(os.path.join(MEDIA_ROOT, "avatars"), exist_ok=True)
 os.makedirs(os.path.join(MEDIA_ROOT, "recipes"), exist_ok=True)
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "foodgram"),
+    }
+}
+
+QUERY_BUDGETS = {
+    "GET recipes-list": 6,
+    "GET recipes-detail": 5,
+    "GET recipes-feed": 6,
+    "GET users-list": 4,
+    "GET users-get-me": 2,
+    "GET users-subscriptions": 6,
+    "GET ingredients-list": 3,
+}
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "False") == "True"
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import time
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с именами файлов по хешу содержимого.
+
+    Одинаковые файлы сохраняются один раз, а поля моделей ссылаются на
+    общий файл. Файл удаляется только тогда, когда на него не ссылается
+    ни одно поле, использующее это хранилище.
+    """
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        extension = os.path.splitext(name)[1].lower()
+        name = os.path.join(
+            os.path.dirname(name), f"{digest.hexdigest()}{extension}"
+        )
+        if self.exists(name):
+            # Обновляем mtime, чтобы сборщик не удалил файл, на который
+            # вот-вот сошлётся ещё не зафиксированная запись.
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
+
+    def _referencing_fields(self):
+        return [
+            (model, field)
+            for model in apps.get_models()
+            for field in model._meta.concrete_fields
+            if isinstance(field, models.FileField)
+            and isinstance(field.storage, ContentAddressedStorage)
+            and field.storage.location == self.location
+        ]
+
+    def referenced_names(self, names):
+        """Возвращает имена из names, на которые ссылаются записи."""
+        names = list(names)
+        referenced = set()
+        for model, field in self._referencing_fields():
+            referenced.update(
+                model._default_manager.filter(
+                    **{f"{field.name}__in": names}
+                ).values_list(field.name, flat=True)
+            )
+        return referenced
+
+    def is_referenced(self, name):
+        return bool(self.referenced_names([name]))
+
+    def is_recent(self, name, grace_period):
+        """Проверяет, изменялся ли файл за последние grace_period секунд."""
+        try:
+            modified_at = os.stat(self.path(name)).st_mtime
+        except FileNotFoundError:
+            return False
+        return time.time() - modified_at < grace_period
+
+    def purge(self, names, grace_period=0):
+        """Удаляет файлы, на которые нет ссылок.
+
+        Файлы, изменённые за последние grace_period секунд, не удаляются.
+        Возвращает пару (удалённые имена, отложенные имена).
+        """
+        names = set(names)
+        candidates = names - self.referenced_names(names)
+        postponed = {
+            name for name in candidates if self.is_recent(name, grace_period)
+        }
+        deleted = candidates - postponed
+        for name in deleted:
+            super().delete(name)
+        return deleted, postponed
+
+    def delete(self, name):
+        if name and not self.is_referenced(name):
+            super().delete(name)
+
+
+content_addressed_storage = ContentAddressedStorage()
@@ -3,12 +3,24 @@ from django.contrib import admin
 from .models import (
     Favorite,
     Ingredient,
+    PendingFileDeletion,
     Recipe,
     RecipeIngredient,
+    RecipeScore,
     ShoppingCart,
+    ShoppingCartTotal,
 )
 
 
+def refresh_shopping_cart_totals(recipe_ids):
+    """Пересчитывает сводные корзины пользователей с этими рецептами."""
+    ShoppingCartTotal.objects.refresh(
+        ShoppingCart.objects.filter(recipe_id__in=recipe_ids)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+
+
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ("name", "measurement_unit")
@@ -24,14 +36,22 @@ class RecipeIngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "author", "get_favorites_count")
+    list_display = (
+        "id",
+        "name",
+        "author",
+        "favorites_count",
+        "in_carts_count",
+    )
     search_fields = ("name", "author__username", "author__email")
     list_filter = ("author", "created_at")
+    list_select_related = ("author",)
     inlines = [RecipeIngredientInline]
 
-    @admin.display(description="Избранное")
-    def get_favorites_count(self, recipe):
-        return recipe.favorites.count()
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            refresh_shopping_cart_totals([form.instance.pk])
 
 
 @admin.register(RecipeIngredient)
@@ -39,9 +59,49 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ("recipe", "ingredient", "amount")
     search_fields = ("recipe__name", "ingredient__name")
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_shopping_cart_totals(
+            {obj.recipe_id, form.initial.get("recipe", obj.recipe_id)}
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_shopping_cart_totals([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list("recipe_id", flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_shopping_cart_totals(recipe_ids)
+
 
 @admin.register(Favorite, ShoppingCart)
 class FavoriteAndShoppingCartAdmin(admin.ModelAdmin):
     list_display = ("user", "recipe")
     search_fields = ("user__email", "recipe__name")
     list_filter = ("user",)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if isinstance(obj, ShoppingCart):
+            ShoppingCartTotal.objects.refresh(
+                {obj.user_id, form.initial.get("user", obj.user_id)}
+            )
+
+
+@admin.register(ShoppingCartTotal)
+class ShoppingCartTotalAdmin(admin.ModelAdmin):
+    list_display = ("user", "ingredient", "total_amount")
+    search_fields = ("user__email", "ingredient__name")
+
+
+@admin.register(PendingFileDeletion)
+class PendingFileDeletionAdmin(admin.ModelAdmin):
+    list_display = ("name", "created_at")
+    search_fields = ("name",)
+
+
+@admin.register(RecipeScore)
+class RecipeScoreAdmin(admin.ModelAdmin):
+    list_display = ("recipe", "score", "computed_at")
+    list_select_related = ("recipe",)
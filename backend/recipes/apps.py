@@ -7,4 +7,4 @@ class RecipesConfig(AppConfig):
     verbose_name = "Рецепты"
 
     def ready(self):
-        pass
+        from . import signals  # noqa: F401
@@ -0,0 +1,196 @@
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+
+from constants import (
+    FEED_BACKFILL_SIZE,
+    FEED_FANOUT_BATCH_SIZE,
+    FEED_FANOUT_MAX_FOLLOWERS,
+    FEED_FANOUT_WORKERS
+)
+from users.models import Subscription, User
+from .models import FeedEntry, Recipe
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=FEED_FANOUT_WORKERS,
+    thread_name_prefix="feed-fanout",
+)
+
+
+def is_celebrity(author):
+    """Проверяет, читаются ли рецепты автора подписчиками напрямую.
+
+    У авторов с числом подписчиков от FEED_FANOUT_MAX_FOLLOWERS рецепты
+    не раскладываются по лентам, а подмешиваются при чтении.
+    """
+    return author.followers_count >= FEED_FANOUT_MAX_FOLLOWERS
+
+
+def _fan_out_recipe(recipe_id):
+    close_old_connections()
+    try:
+        recipe = (
+            Recipe.objects.filter(pk=recipe_id)
+            .values("author_id", "created_at")
+            .first()
+        )
+        if recipe is None:
+            return
+        follower_ids = (
+            Subscription.objects.filter(author_id=recipe["author_id"])
+            .values_list("follower_id", flat=True)
+            .iterator(chunk_size=FEED_FANOUT_BATCH_SIZE)
+        )
+        while batch := list(islice(follower_ids, FEED_FANOUT_BATCH_SIZE)):
+            FeedEntry.objects.bulk_create(
+                [
+                    FeedEntry(
+                        follower_id=follower_id,
+                        recipe_id=recipe_id,
+                        author_id=recipe["author_id"],
+                        created_at=recipe["created_at"],
+                    )
+                    for follower_id in batch
+                ],
+                ignore_conflicts=True,
+            )
+    except Exception:
+        logger.exception("Не удалось разослать рецепт %s в ленты", recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_feed_fan_out(recipe):
+    """Ставит рассылку нового рецепта по лентам подписчиков в очередь."""
+    if is_celebrity(recipe.author):
+        return
+    recipe_id = recipe.pk
+    transaction.on_commit(lambda: executor.submit(_fan_out_recipe, recipe_id))
+
+
+def backfill_feed(follower, author):
+    """Добавляет в ленту подписчика последние рецепты автора."""
+    if is_celebrity(author):
+        return
+    recipes = Recipe.objects.filter(author=author).values_list(
+        "id", "created_at"
+    )[:FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                follower=follower,
+                recipe_id=recipe_id,
+                author=author,
+                created_at=created_at,
+            )
+            for recipe_id, created_at in recipes
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def refill_feeds(follower_ids):
+    """Заново заполняет ленты подписчиков одним INSERT ... SELECT.
+
+    Из каждой подписки берутся последние FEED_BACKFILL_SIZE рецептов
+    автора, как в backfill_feed. Рецепты популярных авторов в ленты
+    не попадают.
+    """
+    follower_ids = list(follower_ids)
+    FeedEntry.objects.filter(follower_id__in=follower_ids).delete()
+    connection = connections[FeedEntry.objects.db]
+    quote_name = connection.ops.quote_name
+
+    def column(model, name):
+        return quote_name(model._meta.get_field(name).column)
+
+    feed_table = quote_name(FeedEntry._meta.db_table)
+    subscription_table = quote_name(Subscription._meta.db_table)
+    recipe_table = quote_name(Recipe._meta.db_table)
+    user_table = quote_name(User._meta.db_table)
+    follower, author = (
+        column(Subscription, name) for name in ("follower", "author")
+    )
+    recipe_id, recipe_author, created_at = (
+        column(Recipe, name) for name in ("id", "author", "created_at")
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {feed_table} ("
+            f"{column(FeedEntry, 'follower')}, "
+            f"{column(FeedEntry, 'recipe')}, "
+            f"{column(FeedEntry, 'author')}, "
+            f"{column(FeedEntry, 'created_at')}) "
+            f"SELECT follower_id, recipe_id, author_id, created_at FROM ("
+            f"SELECT s.{follower} AS follower_id, r.{recipe_id} AS recipe_id, "
+            f"s.{author} AS author_id, r.{created_at} AS created_at, "
+            f"ROW_NUMBER() OVER (PARTITION BY s.{follower}, s.{author} "
+            f"ORDER BY r.{created_at} DESC, r.{recipe_id} DESC) AS position "
+            f"FROM {subscription_table} s "
+            f"JOIN {user_table} a ON a.{column(User, 'id')} = s.{author} "
+            f"JOIN {recipe_table} r ON r.{recipe_author} = s.{author} "
+            f"WHERE s.{follower} IN ({', '.join(['%s'] * len(follower_ids))})"
+            f" AND a.{column(User, 'followers_count')} < %s"
+            f") ranked WHERE position <= %s "
+            f"ON CONFLICT DO NOTHING",
+            [*follower_ids, FEED_FANOUT_MAX_FOLLOWERS, FEED_BACKFILL_SIZE],
+        )
+
+
+def prune_feed(follower, author):
+    """Убирает рецепты автора из ленты бывшего подписчика."""
+    FeedEntry.objects.filter(follower=follower, author=author).delete()
+
+
+def _before(position, created_at_field, id_field):
+    if position is None:
+        return Q()
+    created_at, recipe_id = position
+    return Q(**{f"{created_at_field}__lt": created_at}) | Q(
+        **{created_at_field: created_at, f"{id_field}__lt": recipe_id}
+    )
+
+
+def get_feed_page(user, limit, position=None):
+    """Возвращает страницу ленты подписок.
+
+    Страница - список ключей (created_at, id рецепта) после position
+    в порядке убывания. Вторым значением возвращается признак
+    следующей страницы. Каждый источник читает не больше limit + 1
+    строк по индексу, поэтому время чтения не зависит от размера ленты.
+    """
+    inbox = (
+        FeedEntry.objects.filter(follower=user)
+        .filter(_before(position, "created_at", "recipe_id"))
+        .order_by("-created_at", "-recipe_id")
+        .values_list("created_at", "recipe_id")[: limit + 1]
+    )
+    sources = [inbox]
+    celebrity_ids = list(
+        user.follower.filter(
+            author__followers_count__gte=FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list("author_id", flat=True)
+    )
+    if celebrity_ids:
+        sources.append(
+            Recipe.objects.filter(author_id__in=celebrity_ids)
+            .filter(_before(position, "created_at", "id"))
+            .order_by("-created_at", "-id")
+            .values_list("created_at", "id")[: limit + 1]
+        )
+
+    keys, seen = [], set()
+    for key in heapq.merge(*sources, reverse=True):
+        if key[1] in seen:
+            continue
+        seen.add(key[1])
+        keys.append(key)
+        if len(keys) > limit:
+            break
+    return keys[:limit], len(keys) > limit
@@ -0,0 +1,185 @@
+import logging
+import operator
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from constants import IMAGE_PROCESSING_WORKERS, IMAGE_VARIANTS
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "variants"
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix="image-variants",
+)
+
+
+def _render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail((size, size))
+    if image_format == "JPEG" and variant.mode != "RGB":
+        variant = variant.convert("RGB")
+    buffer = BytesIO()
+    variant.save(buffer, format=image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def build_variants(image_name):
+    """Проверяет изображение и сохраняет его уменьшенные копии.
+
+    Имя исходного файла - хеш его содержимого, поэтому уже построенные
+    копии того же изображения используются повторно.
+    Возвращает словарь {название варианта: путь в хранилище}.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    directory = os.path.join(os.path.dirname(image_name), VARIANTS_DIR)
+    variants = {
+        name: os.path.join(directory, f"{stem}_{name}.{extension}")
+        for name, (_, _, extension) in IMAGE_VARIANTS.items()
+    }
+    missing = [
+        name
+        for name, variant_name in variants.items()
+        if not default_storage.exists(variant_name)
+    ]
+    if not missing:
+        return variants
+
+    with Recipe.image.field.storage.open(image_name, "rb") as image_file:
+        image = Image.open(image_file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    for name in missing:
+        size, image_format, _ = IMAGE_VARIANTS[name]
+        saved_name = default_storage.save(
+            variants[name],
+            ContentFile(_render_variant(image, size, image_format)),
+        )
+        if saved_name != variants[name]:
+            # Ту же копию параллельно построил другой воркер.
+            default_storage.delete(saved_name)
+    return variants
+
+
+def is_variant(name):
+    """Проверяет, является ли файл уменьшенной копией изображения."""
+    return os.path.basename(os.path.dirname(name)) == VARIANTS_DIR
+
+
+def _variant_source_prefix(variant_name):
+    # recipes/variants/<хеш>_<вариант>.<расширение> -> recipes/<хеш>.
+    directory = os.path.dirname(os.path.dirname(variant_name))
+    stem = os.path.basename(variant_name).rsplit("_", 1)[0]
+    return os.path.join(directory, f"{stem}.")
+
+
+def purge_variants(names, grace_period=0):
+    """Удаляет копии изображений, исходник которых больше не используется.
+
+    Исходник ищется по хешу в имени копии: одно изображение может быть у
+    нескольких рецептов. Копии, изменённые за последние grace_period
+    секунд, не удаляются. Возвращает пару (удалённые, отложенные).
+    """
+    prefixes = {name: _variant_source_prefix(name) for name in names}
+    if not prefixes:
+        return set(), set()
+    images = Recipe.objects.filter(
+        reduce(
+            operator.or_,
+            (Q(image__startswith=prefix) for prefix in set(prefixes.values())),
+        )
+    ).values_list("image", flat=True)
+    referenced = {
+        os.path.join(
+            os.path.dirname(image),
+            f"{os.path.splitext(os.path.basename(image))[0]}.",
+        )
+        for image in images
+    }
+    storage = Recipe.image.field.storage
+    deleted, postponed = set(), set()
+    for name, prefix in prefixes.items():
+        if prefix in referenced:
+            continue
+        if storage.is_recent(name, grace_period):
+            postponed.add(name)
+            continue
+        default_storage.delete(name)
+        deleted.add(name)
+    return deleted, postponed
+
+
+def _delete_unused_variants(image_name, variant_names):
+    if image_name and Recipe.objects.filter(image=image_name).exists():
+        return
+    for variant_name in variant_names:
+        default_storage.delete(variant_name)
+
+
+def _reject_recipe_image(recipe_id, image_name):
+    # Файл, который не открывается Pillow, не должен оставаться
+    # изображением рецепта: он отдаётся из MEDIA как есть. Сохранение
+    # через save() ставит файл в очередь на удаление сигналами.
+    recipe = Recipe.objects.filter(pk=recipe_id, image=image_name).first()
+    if recipe is None:
+        return
+    recipe.image = ""
+    recipe.image_variants = {}
+    recipe.save(update_fields=["image", "image_variants", "updated_at"])
+
+
+def _process_recipe_image(recipe_id, image_name, stale_image, stale_variants):
+    close_old_connections()
+    try:
+        _delete_unused_variants(stale_image, stale_variants)
+        try:
+            variants = build_variants(image_name)
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            logger.warning(
+                "Не удалось обработать изображение %s: %s", image_name, error
+            )
+            _reject_recipe_image(recipe_id, image_name)
+            return
+
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None or recipe.image.name != image_name:
+            _delete_unused_variants(image_name, variants.values())
+            return
+        recipe.image_variants = variants
+        recipe.save(update_fields=["image_variants", "updated_at"])
+    finally:
+        close_old_connections()
+
+
+def schedule_recipe_image_processing(
+    recipe, stale_image=None, stale_variants=()
+):
+    """Ставит построение вариантов изображения рецепта в очередь.
+
+    Задача запускается после фиксации транзакции, чтобы воркер увидел
+    сохранённый файл и запись рецепта. Копии прежнего изображения
+    stale_image удаляются, если оно больше не используется.
+    """
+    if not recipe.image:
+        return
+    image_name = recipe.image.name
+    stale_variants = list(stale_variants)
+    transaction.on_commit(
+        lambda: executor.submit(
+            _process_recipe_image,
+            recipe.pk,
+            image_name,
+            stale_image,
+            stale_variants,
+        )
+    )
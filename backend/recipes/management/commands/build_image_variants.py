@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Построение уменьшенных копий изображений рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Перестроить копии и для рецептов, у которых они уже есть",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="").exclude(image=None)
+        if not options["all"]:
+            recipes = recipes.filter(image_variants={})
+
+        processed = 0
+        for recipe in recipes.only("id", "image", "image_variants").iterator():
+            try:
+                recipe.image_variants = build_variants(recipe.image.name)
+            except (OSError, ValueError) as e:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Не удалось обработать {recipe.image.name}: {e}"
+                    )
+                )
+                continue
+            recipe.save(update_fields=["image_variants", "updated_at"])
+            processed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Обработано изображений: {processed}")
+        )
@@ -1,56 +1,110 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
-from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from recipes.models import Recipe
+from constants import MEDIA_DELETION_GRACE_PERIOD
+from recipes.models import PendingFileDeletion, Recipe
 from users.models import User
 
 
+def unlink(path):
+    """Удаляет файл, возвращает False, если его уже нет."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
 class Command(BaseCommand):
     help = "Удаление неиспользуемых аватаров и изображений рецептов"
 
-    def handle(self, *args, **options):
-        recipe_images = set(
-            Recipe.objects.exclude(image="").values_list("image", flat=True)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать неиспользуемые файлы, ничего не удаляя",
         )
-        avatar_images = set(
-            User.objects.exclude(avatar="").values_list("avatar", flat=True)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество файлов, проверяемых одним запросом",
         )
+        parser.add_argument(
+            "--grace-period",
+            type=int,
+            default=MEDIA_DELETION_GRACE_PERIOD,
+            help="Не удалять файлы, изменённые за это число секунд",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Количество потоков для удаления файлов",
+        )
+
+    def _iter_files(self, directory):
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            return
 
-        avatars_dir = os.path.join(
-            settings.MEDIA_ROOT, "data", "images", "avatars"
+    def _find_orphans(self, field, entries, modified_before):
+        names = {
+            f"{field.upload_to}{entry.name}": entry for entry in entries
+        }
+        referenced = set(
+            field.model._default_manager.filter(
+                **{f"{field.name}__in": names}
+            ).values_list(field.name, flat=True)
         )
-        recipes_dir = os.path.join(
-            settings.MEDIA_ROOT, "data", "images", "recipes"
+        return {
+            name: entry.path
+            for name, entry in names.items()
+            if name not in referenced
+            and entry.stat(follow_symlinks=False).st_mtime < modified_before
+        }
+
+    def _cleanup_field(self, field, options, executor):
+        storage = field.storage
+        modified_before = time.time() - options["grace_period"]
+        files = self._iter_files(storage.path(field.upload_to))
+        scanned_count = orphan_count = deleted_count = 0
+        while chunk := list(islice(files, options["batch_size"])):
+            scanned_count += len(chunk)
+            orphans = self._find_orphans(field, chunk, modified_before)
+            orphan_count += len(orphans)
+            if options["verbosity"] > 1:
+                for name in orphans:
+                    self.stdout.write(f"Неиспользуемый файл: {name}")
+            if options["dry_run"] or not orphans:
+                continue
+
+            deleted_count += sum(executor.map(unlink, orphans.values()))
+            PendingFileDeletion.objects.filter(name__in=orphans).delete()
+
+        self.stdout.write(
+            f"{field.upload_to}: проверено файлов {scanned_count}, "
+            f"неиспользуемых {orphan_count}, удалено {deleted_count}."
         )
 
-        if os.path.exists(avatars_dir):
-            for filename in os.listdir(avatars_dir):
-                file_path = os.path.join("data", "images", "avatars", filename)
-                if file_path not in avatar_images:
-                    full_path = os.path.join(settings.MEDIA_ROOT, file_path)
-                    try:
-                        os.remove(full_path)
-                        self.stdout.write(
-                            f"Deleted unused avatar: {file_path}"
-                        )
-                    except OSError as e:
-                        self.stdout.write(f"Error deleting {file_path}: {e}")
-
-        if os.path.exists(recipes_dir):
-            for filename in os.listdir(recipes_dir):
-                file_path = os.path.join("data", "images", "recipes", filename)
-                if file_path not in recipe_images:
-                    full_path = os.path.join(settings.MEDIA_ROOT, file_path)
-                    try:
-                        os.remove(full_path)
-                        self.stdout.write(
-                            f"Deleted unused recipe image: {file_path}"
-                        )
-                    except OSError as e:
-                        self.stdout.write(f"Error deleting {file_path}: {e}")
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            for field in (Recipe.image.field, User.avatar.field):
+                self._cleanup_field(field, options, executor)
 
+        if options["dry_run"]:
+            self.stdout.write(
+                self.style.SUCCESS("Пробный запуск: файлы не удалялись.")
+            )
+            return
         self.stdout.write(
-            self.style.SUCCESS("Successfully cleaned up unused images")
+            self.style.SUCCESS("Неиспользуемые изображения удалены.")
         )
@@ -0,0 +1,30 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import RecipeScore
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт рейтинга популярных рецептов по недавним добавлениям "
+        "в избранное и корзины"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Размер пакета при записи",
+        )
+
+    def handle(self, *args, **options):
+        started_at = monotonic()
+        scored = RecipeScore.objects.rebuild(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Рейтинг пересчитан для {scored} рецептов "
+                f"за {monotonic() - started_at:.2f} с."
+            )
+        )
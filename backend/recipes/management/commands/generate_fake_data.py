@@ -0,0 +1,233 @@
+import random
+from datetime import timedelta
+from itertools import islice
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from users.models import Subscription
+
+
+UserModel = get_user_model()
+
+MEASUREMENT_UNITS = ("г", "кг", "мл", "л", "шт", "ст. л.", "ч. л.")
+
+
+class Command(BaseCommand):
+    help = "Генерация синтетических данных для нагрузочного тестирования"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000, help="Количество пользователей"
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=10000, help="Количество рецептов"
+        )
+        parser.add_argument(
+            "--ingredients-per-recipe",
+            type=int,
+            default=8,
+            help="Количество продуктов в рецепте",
+        )
+        parser.add_argument(
+            "--ingredients",
+            type=int,
+            default=2000,
+            help="Сколько продуктов создать, если справочник пуст",
+        )
+        parser.add_argument(
+            "--favorites",
+            type=int,
+            default=20,
+            help="Количество рецептов в избранном у пользователя",
+        )
+        parser.add_argument(
+            "--carts",
+            type=int,
+            default=5,
+            help="Количество рецептов в корзине у пользователя",
+        )
+        parser.add_argument(
+            "--subscriptions",
+            type=int,
+            default=10,
+            help="Количество подписок у пользователя",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Количество записей в одном INSERT",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None, help="Начальное значение ГПСЧ"
+        )
+
+    def _bulk_create(self, model, objects, ignore_conflicts=False):
+        created_count = 0
+        with transaction.atomic():
+            while batch := list(islice(objects, self.batch_size)):
+                model.objects.bulk_create(
+                    batch, ignore_conflicts=ignore_conflicts
+                )
+                created_count += len(batch)
+        self.stdout.write(
+            f"{model._meta.verbose_name_plural}: {created_count}"
+        )
+
+    def _ingredient_ids(self, count):
+        if not Ingredient.objects.exists():
+            self._bulk_create(
+                Ingredient,
+                (
+                    Ingredient(
+                        name=f"Продукт {number}",
+                        measurement_unit=self.random.choice(
+                            MEASUREMENT_UNITS
+                        ),
+                    )
+                    for number in range(count)
+                ),
+            )
+        return list(Ingredient.objects.values_list("id", flat=True))
+
+    def _create_users(self, count, run):
+        if UserModel.objects.filter(
+            username__startswith=f"bench_{run}_"
+        ).exists():
+            raise CommandError(
+                f"Пользователи запуска {run} уже созданы, "
+                f"укажите другое значение --seed."
+            )
+        password = make_password("password")
+        usernames = [f"bench_{run}_{number}" for number in range(count)]
+        self._bulk_create(
+            UserModel,
+            (
+                UserModel(
+                    username=username,
+                    email=f"{username}@example.com",
+                    first_name="Тест",
+                    last_name=f"Пользователь {number}",
+                    password=password,
+                )
+                for number, username in enumerate(usernames)
+            ),
+        )
+        return list(
+            UserModel.objects.filter(username__in=usernames).values_list(
+                "id", flat=True
+            )
+        )
+
+    def _create_recipes(self, count, author_ids):
+        last_id = Recipe.objects.order_by("-id").values_list(
+            "id", flat=True
+        ).first() or 0
+        self._bulk_create(
+            Recipe,
+            (
+                Recipe(
+                    author_id=self.random.choice(author_ids),
+                    name=f"Рецепт {number}",
+                    text="Синтетический рецепт для нагрузочного теста.",
+                    cooking_time=self.random.randint(1, 180),
+                )
+                for number in range(count)
+            ),
+        )
+        return list(
+            Recipe.objects.filter(
+                id__gt=last_id, author_id__in=author_ids
+            ).values_list("id", flat=True)
+        )
+
+    def _random_moment(self, now, days=30):
+        return now - timedelta(hours=self.random.uniform(0, 24 * days))
+
+    def _sample(self, population, count, exclude=None):
+        sample = self.random.sample(
+            population, min(count + 1, len(population))
+        )
+        return [item for item in sample if item != exclude][:count]
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["recipes"] < 1:
+            raise CommandError("Нужен хотя бы один пользователь и рецепт.")
+        self.random = random.Random(options["seed"])
+        # Метка запуска берётся из ГПСЧ первой, чтобы --seed воспроизводил
+        # имена пользователей независимо от содержимого базы.
+        run = f"{self.random.getrandbits(24):06x}"
+        self.batch_size = options["batch_size"]
+        started_at = monotonic()
+        now = timezone.now()
+
+        ingredient_ids = self._ingredient_ids(options["ingredients"])
+        user_ids = self._create_users(options["users"], run)
+        recipe_ids = self._create_recipes(options["recipes"], user_ids)
+
+        self._bulk_create(
+            RecipeIngredient,
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in self._sample(
+                    ingredient_ids, options["ingredients_per_recipe"]
+                )
+            ),
+        )
+        for model, per_user in (
+            (Favorite, options["favorites"]),
+            (ShoppingCart, options["carts"]),
+        ):
+            self._bulk_create(
+                model,
+                (
+                    model(
+                        user_id=user_id,
+                        recipe_id=recipe_id,
+                        created_at=self._random_moment(now),
+                    )
+                    for user_id in user_ids
+                    for recipe_id in self._sample(recipe_ids, per_user)
+                ),
+                ignore_conflicts=True,
+            )
+        self._bulk_create(
+            Subscription,
+            (
+                Subscription(follower_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in self._sample(
+                    user_ids, options["subscriptions"], exclude=user_id
+                )
+            ),
+            ignore_conflicts=True,
+        )
+        call_command("rebuild_shopping_cart_totals", stdout=self.stdout)
+        call_command("reconcile_counters", stdout=self.stdout)
+        call_command("compute_recipe_scores", stdout=self.stdout)
+        call_command("rebuild_feeds", stdout=self.stdout)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Синтетические данные созданы за "
+                f"{monotonic() - started_at:.2f} с."
+            )
+        )
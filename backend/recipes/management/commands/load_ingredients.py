@@ -1,52 +1,109 @@
+import csv
 import json
 import os
+from itertools import islice
+from time import monotonic
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from tqdm import tqdm
 
 from recipes.models import Ingredient
 
+JSON_READ_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = " \t\r\n,["
+
+
+def iter_json_items(file):
+    """Потоково читает объекты из JSON-массива, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    for chunk in iter(lambda: file.read(JSON_READ_CHUNK_SIZE), ""):
+        buffer += chunk
+        position = 0
+        while True:
+            while (
+                position < len(buffer) and buffer[position] in JSON_SEPARATORS
+            ):
+                position += 1
+            if position == len(buffer) or buffer[position] == "]":
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+        buffer = buffer[position:]
+
+    if buffer.strip(JSON_SEPARATORS + "]"):
+        raise ValueError("Некорректный JSON в конце файла.")
+
+
+def iter_csv_items(file):
+    """Потоково читает строки CSV-файла вида "название,единица"."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield {"name": row[0], "measurement_unit": row[1]}
+
 
 class Command(BaseCommand):
-    help = "Импорт данных об ингредиентах из JSON-файла"
+    help = "Импорт данных об ингредиентах из JSON- или CSV-файла"
 
-    def handle(self, *args, **kwargs):
-        json_file_path = os.path.join("data", "ingredients.json")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=os.path.join("data", "ingredients.json"),
+            help="Путь к файлу .json или .csv",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество строк в одном INSERT",
+        )
 
-        try:
-            with open(json_file_path, "r", encoding="utf-8") as json_file:
-                ingredients_data = json.load(json_file)
-
-            Ingredient.objects.all().delete()
-            total_items = len(ingredients_data)
-
-            progress_bar = tqdm(
-                ingredients_data,
-                total=total_items,
-                bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} "
-                "[{elapsed}<{remaining}]",
-                desc="Загрузка ингредиентов",
-            )
+    def handle(self, *args, **options):
+        file_path = options["path"]
+        batch_size = options["batch_size"]
+        reader = (
+            iter_csv_items
+            if file_path.endswith(".csv")
+            else iter_json_items
+        )
 
-            created_count = 0
-            for ingredient_item in progress_bar:
-                ingredient_name = ingredient_item.get("name")
-                unit = ingredient_item.get("measurement_unit")
+        try:
+            initial_count = Ingredient.objects.count()
+            started_at = monotonic()
+            total_items = 0
 
-                if ingredient_name and unit:
-                    _, created = Ingredient.objects.get_or_create(
-                        name=ingredient_name, measurement_unit=unit
+            with open(file_path, "r", encoding="utf-8") as source_file:
+                ingredients = (
+                    Ingredient(
+                        name=item["name"],
+                        measurement_unit=item["measurement_unit"],
                     )
-                    if created:
-                        created_count += 1
-
-                progress = 100 * (progress_bar.n / total_items)
-                progress_bar.set_postfix({"Прогресс": f"{progress:.1f}%"})
+                    for item in tqdm(
+                        reader(source_file),
+                        desc="Загрузка ингредиентов",
+                        unit=" строк",
+                    )
+                    if item.get("name") and item.get("measurement_unit")
+                )
+                with transaction.atomic():
+                    while batch := list(islice(ingredients, batch_size)):
+                        Ingredient.objects.bulk_create(
+                            batch, ignore_conflicts=True
+                        )
+                        total_items += len(batch)
 
+            elapsed = monotonic() - started_at
+            created_count = Ingredient.objects.count() - initial_count
             self.stdout.write(
                 self.style.SUCCESS(
                     f"Завершено! Успешно загружено {created_count} "
-                    f"ингредиентов из {total_items} записей."
+                    f"ингредиентов из {total_items} записей "
+                    f"за {elapsed:.2f} с "
+                    f"({total_items / max(elapsed, 1e-6):.0f} строк/с)."
                 )
             )
         except Exception as e:
@@ -1,70 +1,186 @@
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from django.contrib.auth import get_user_model
-from django.core.files.images import ImageFile
+from django.core.files import File
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from recipes.management.commands.load_ingredients import iter_json_items
 from recipes.models import Ingredient, Recipe, RecipeIngredient
 
 
 UserModel = get_user_model()
 
 
-class Command(BaseCommand):
-    help = "Импорт кулинарных рецептов из JSON-файла"
+def copy_image(source_path):
+    """Копирует изображение рецепта в хранилище медиафайлов.
 
-    def handle(self, *args, **kwargs):
-        json_file_path = os.path.join("data", "recipes.json")
+    Повторяющиеся изображения сохраняются в хранилище один раз.
+    """
+    with open(source_path, "rb") as image_file:
+        return Recipe.image.field.storage.save(
+            Recipe.image.field.generate_filename(
+                None, os.path.basename(source_path)
+            ),
+            File(image_file),
+        )
 
-        with open(json_file_path, "r", encoding="utf-8") as json_data:
-            recipes_collection = json.load(json_data)
 
-        Recipe.objects.all().delete()
+class Command(BaseCommand):
+    help = "Импорт кулинарных рецептов из JSON-файла"
 
-        for recipe_entry in recipes_collection:
-            recipe_author = UserModel.objects.filter(
-                username=recipe_entry["author"]
-            ).first()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=os.path.join("data", "recipes.json"),
+            help="Путь к JSON-файлу с рецептами",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Количество рецептов в одной транзакции",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Количество потоков для копирования изображений",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Начать импорт заново, игнорируя сохранённый прогресс",
+        )
+
+    def _read_checkpoint(self, checkpoint_path, source_path):
+        try:
+            with open(checkpoint_path, "r", encoding="utf-8") as file:
+                checkpoint = json.load(file)
+        except (OSError, ValueError):
+            return 0
+        if checkpoint.get("source") != os.path.abspath(source_path):
+            return 0
+        return checkpoint.get("processed", 0)
+
+    def _write_checkpoint(self, checkpoint_path, source_path, processed):
+        temporary_path = f"{checkpoint_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "source": os.path.abspath(source_path),
+                    "processed": processed,
+                },
+                file,
+            )
+        os.replace(temporary_path, checkpoint_path)
 
-            if not recipe_author:
+    def _import_batch(self, batch, authors, ingredients, existing, executor):
+        recipes, recipe_ingredients, image_paths = [], [], []
+        for recipe_entry in batch:
+            author_id = authors.get(recipe_entry["author"])
+            if not author_id:
                 self.stdout.write(
                     self.style.WARNING(
                         f"Пользователь {recipe_entry['author']} не найден."
                     )
                 )
                 continue
-
-            new_recipe_entry = Recipe.objects.create(
-                name=recipe_entry["name"],
-                text=recipe_entry["text"],
-                cooking_time=recipe_entry["cooking_time"],
-                author=recipe_author,
+            if (author_id, recipe_entry["name"]) in existing:
+                continue
+            existing.add((author_id, recipe_entry["name"]))
+
+            recipes.append(
+                Recipe(
+                    name=recipe_entry["name"],
+                    text=recipe_entry["text"],
+                    cooking_time=recipe_entry["cooking_time"],
+                    author_id=author_id,
+                )
+            )
+            image_paths.append(
+                os.path.join("data", recipe_entry["image"])
+                if recipe_entry.get("image")
+                else None
+            )
+            recipe_ingredients.append(
+                {
+                    ingredients[component["name"]]: component["amount"]
+                    for component in recipe_entry["ingredients"]
+                    if component["name"] in ingredients
+                }
             )
 
-            if recipe_entry.get("image"):
-                image_full_path = os.path.join("data", recipe_entry["image"])
-                with open(image_full_path, "rb") as image_file:
-                    new_recipe_entry.image.save(
-                        os.path.basename(image_full_path),
-                        ImageFile(image_file),
-                        save=True,
-                    )
-
-            for ingredient_component in recipe_entry["ingredients"]:
-                ingredient_item = Ingredient.objects.filter(
-                    name=ingredient_component["name"]
-                ).first()
+        images = executor.map(
+            lambda path: copy_image(path) if path else None, image_paths
+        )
+        for recipe, image in zip(recipes, images):
+            recipe.image = image
+
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                )
+                for recipe, amounts in zip(recipes, recipe_ingredients)
+                for ingredient_id, amount in amounts.items()
+            )
+        return recipes
+
+    def handle(self, *args, **options):
+        json_file_path = options["path"]
+        batch_size = options["batch_size"]
+        checkpoint_path = f"{json_file_path}.checkpoint"
+
+        processed = (
+            0
+            if options["restart"]
+            else self._read_checkpoint(checkpoint_path, json_file_path)
+        )
+        if processed:
+            self.stdout.write(
+                f"Продолжаем импорт с записи {processed + 1}."
+            )
 
-                if ingredient_item:
-                    RecipeIngredient.objects.create(
-                        recipe=new_recipe_entry,
-                        ingredient=ingredient_item,
-                        amount=ingredient_component["amount"],
+        authors = dict(UserModel.objects.values_list("username", "id"))
+        ingredients = {}
+        for name, ingredient_id in Ingredient.objects.values_list(
+            "name", "id"
+        ):
+            ingredients.setdefault(name, ingredient_id)
+        existing = set(Recipe.objects.values_list("author_id", "name"))
+
+        with ThreadPoolExecutor(
+            max_workers=options["workers"]
+        ) as executor, open(
+            json_file_path, "r", encoding="utf-8"
+        ) as json_data:
+            recipes_collection = islice(
+                iter_json_items(json_data), processed, None
+            )
+            while batch := list(islice(recipes_collection, batch_size)):
+                created = self._import_batch(
+                    batch, authors, ingredients, existing, executor
+                )
+                processed += len(batch)
+                self._write_checkpoint(
+                    checkpoint_path, json_file_path, processed
+                )
+                for recipe in created:
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f'Добавлен рецепт: "{recipe.name}"'
+                        )
                     )
 
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Добавлен рецепт: "{new_recipe_entry.name}"'
-                )
-            )
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        call_command("reconcile_counters", stdout=self.stdout)
+        self.stdout.write(
+            self.style.SUCCESS(f"Импорт завершён, обработано {processed}.")
+        )
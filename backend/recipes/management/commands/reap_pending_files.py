@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from constants import MEDIA_DELETION_GRACE_PERIOD
+from foodgram.storage import content_addressed_storage
+from recipes.images import is_variant, purge_variants
+from recipes.models import PendingFileDeletion
+
+
+class Command(BaseCommand):
+    help = "Удаление файлов из очереди, на которые больше нет ссылок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Количество файлов, обрабатываемых за один проход",
+        )
+        parser.add_argument(
+            "--grace-period",
+            type=int,
+            default=MEDIA_DELETION_GRACE_PERIOD,
+            help="Не удалять файлы, изменённые за это число секунд",
+        )
+
+    def handle(self, *args, **options):
+        last_id = 0
+        deleted_count = postponed_count = 0
+        while batch := dict(
+            PendingFileDeletion.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "name")[: options["batch_size"]]
+        ):
+            last_id = max(batch)
+            variants = {name for name in batch.values() if is_variant(name)}
+            deleted, postponed = content_addressed_storage.purge(
+                set(batch.values()) - variants, options["grace_period"]
+            )
+            deleted_variants, postponed_variants = purge_variants(
+                variants, options["grace_period"]
+            )
+            deleted |= deleted_variants
+            postponed |= postponed_variants
+            PendingFileDeletion.objects.filter(id__in=batch).exclude(
+                name__in=postponed
+            ).delete()
+            deleted_count += len(deleted)
+            postponed_count += len(postponed)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Удалено файлов: {deleted_count}, "
+                f"отложено до следующего запуска: {postponed_count}."
+            )
+        )
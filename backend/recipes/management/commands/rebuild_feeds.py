@@ -0,0 +1,32 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from constants import FEED_REBUILD_BATCH_SIZE
+from recipes.feed import refill_feeds
+from recipes.models import FeedEntry
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Заполнение лент подписок по существующим подпискам"
+
+    def handle(self, *args, **options):
+        started_at = monotonic()
+        last_id = 0
+        while follower_ids := list(
+            User.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:FEED_REBUILD_BATCH_SIZE]
+        ):
+            # Каждая пачка пользователей - отдельная короткая транзакция.
+            with transaction.atomic():
+                refill_feeds(follower_ids)
+            last_id = follower_ids[-1]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ленты заполнены: {FeedEntry.objects.count()} записей "
+                f"за {monotonic() - started_at:.2f} с."
+            )
+        )
@@ -0,0 +1,85 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = "Пересчёт сводных корзин покупок по текущему содержимому корзин"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только сравнить сводные корзины с фактическими данными",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Размер пакета при записи",
+        )
+
+    def _live_totals(self):
+        return (
+            RecipeIngredient.objects.filter(
+                recipe__shoppingcarts__isnull=False
+            )
+            .values_list("recipe__shoppingcarts__user_id", "ingredient_id")
+            .annotate(total_amount=Sum("amount"))
+            .order_by()
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            stored = {
+                (user_id, ingredient_id): total_amount
+                for user_id, ingredient_id, total_amount in (
+                    ShoppingCartTotal.objects.values_list(
+                        "user_id", "ingredient_id", "total_amount"
+                    ).iterator()
+                )
+            }
+            mismatches = 0
+            for user_id, ingredient_id, total_amount in (
+                self._live_totals().iterator()
+            ):
+                if stored.pop((user_id, ingredient_id), None) != total_amount:
+                    mismatches += 1
+            mismatches += len(stored)
+
+            if mismatches:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Найдено расхождений: {mismatches}. "
+                        "Запустите команду без --check для пересчёта."
+                    )
+                )
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS("Сводные корзины актуальны.")
+                )
+            return
+
+        live_totals = self._live_totals().iterator()
+        with transaction.atomic():
+            ShoppingCartTotal.objects.all().delete()
+            while batch := list(islice(live_totals, options["batch_size"])):
+                ShoppingCartTotal.objects.bulk_create(
+                    ShoppingCartTotal(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=total_amount,
+                    )
+                    for user_id, ingredient_id, total_amount in batch
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Сводные корзины пересчитаны: "
+                f"{ShoppingCartTotal.objects.count()} записей."
+            )
+        )
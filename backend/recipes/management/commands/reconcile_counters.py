@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "in_carts_count", ShoppingCart, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "followers_count", Subscription, "author"),
+)
+
+
+class Command(BaseCommand):
+    help = "Сверка счётчиков рецептов и пользователей с фактическими данными"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только показать расхождения, ничего не исправляя",
+        )
+
+    def _actual(self, related_model, related_field):
+        return Coalesce(
+            Subquery(
+                related_model.objects.filter(
+                    **{related_field: OuterRef("pk")}
+                )
+                .order_by()
+                .values(related_field)
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            Value(0),
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, related_model, related_field in COUNTERS:
+            actual = self._actual(related_model, related_field)
+            drifted = model.objects.exclude(**{counter: actual})
+            label = f"{model._meta.verbose_name_plural}.{counter}"
+            if options["check"]:
+                self.stdout.write(f"{label}: расхождений {drifted.count()}")
+                continue
+            # Один UPDATE с подзапросом: значение считается в момент
+            # записи, и параллельные F()-приращения не теряются.
+            fixed = drifted.update(**{counter: actual})
+            self.stdout.write(f"{label}: исправлено {fixed}")
+
+        self.stdout.write(self.style.SUCCESS("Сверка счётчиков завершена."))
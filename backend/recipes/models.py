@@ -1,13 +1,28 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import chain
+
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import Greatest, TruncHour
+from django.utils import timezone
 
 from constants import (
     INGREDIENT_MEASUREMENT_UNIT_MAX_LENGTH,
     INGREDIENT_NAME_MAX_LENGTH,
+    PENDING_FILE_DELETION_MAX_LENGTH,
     RECIPE_INGREDIENT_MIN_AMOUNT,
     RECIPE_MIN_COOKING_TIME,
-    RECIPE_NAME_MAX_LENGTH
+    RECIPE_NAME_MAX_LENGTH,
+    SHOPPING_CART_UPSERT_BATCH_SIZE,
+    TRENDING_FAVORITE_WEIGHT,
+    TRENDING_HALF_LIFE_HOURS,
+    TRENDING_SHOPPING_CART_WEIGHT,
+    TRENDING_WINDOW_DAYS
 )
+from foodgram.managers import InsertIgnoreManager
+from foodgram.storage import content_addressed_storage
 from users.models import User
 
 
@@ -55,12 +70,24 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name="Изображение",
         upload_to="recipes/",
+        storage=content_addressed_storage,
         blank=True,
         null=True,
+        db_index=True,
+    )
+
+    image_variants = models.JSONField(
+        verbose_name="Уменьшенные копии изображения",
+        default=dict,
+        blank=True,
+        editable=False,
     )
 
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE, verbose_name="Автор"
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Автор",
+        db_index=False,
     )
 
     cooking_time = models.PositiveIntegerField(
@@ -78,11 +105,36 @@ class Recipe(models.Model):
         auto_now_add=True, verbose_name="Дата создания"
     )
 
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name="Дата изменения"
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном", default=0, editable=False
+    )
+
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В корзинах", default=0, editable=False
+    )
+
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
-        ordering = ("-created_at",)
+        ordering = ("-created_at", "-id")
         default_related_name = "recipes"
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"], name="recipe_created_idx"
+            ),
+            models.Index(
+                fields=["author", "-created_at", "-id"],
+                name="recipe_author_created_idx",
+            ),
+            models.Index(
+                fields=["-favorites_count", "-created_at", "-id"],
+                name="recipe_favorites_count_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"ID рецепта: {self.id} | {self.name}"
@@ -92,7 +144,10 @@ class RecipeIngredient(models.Model):
     """Промежуточная модель для связи рецептов с ингредиентами."""
 
     recipe = models.ForeignKey(
-        Recipe, on_delete=models.CASCADE, verbose_name="Рецепт"
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+        db_index=False,
     )
 
     ingredient = models.ForeignKey(
@@ -135,6 +190,7 @@ class BaseUserRecipe(models.Model):
         on_delete=models.CASCADE,
         verbose_name="Пользователь",
         related_name="%(class)ss",
+        db_index=False,
     )
 
     recipe = models.ForeignKey(
@@ -144,6 +200,17 @@ class BaseUserRecipe(models.Model):
         related_name="%(class)ss",
     )
 
+    # Без default: при добавлении столбца существующие записи получают
+    # NULL, а не время миграции, и не попадают в рейтинг популярного
+    # как свежие. Новым записям время ставит сигнал stamp_created_at.
+    created_at = models.DateTimeField(
+        verbose_name="Дата добавления",
+        null=True,
+        editable=False,
+    )
+
+    objects = InsertIgnoreManager()
+
     class Meta:
         abstract = True
         ordering = ["user", "recipe"]
@@ -153,6 +220,11 @@ class BaseUserRecipe(models.Model):
                 name="%(app_label)s_%(class)s_unique_user_recipe",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["created_at"], name="%(class)s_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.recipe.name}"
@@ -172,3 +244,337 @@ class ShoppingCart(BaseUserRecipe):
     class Meta(BaseUserRecipe.Meta):
         verbose_name = "Корзина покупок"
         verbose_name_plural = "Корзины покупок"
+
+
+class ShoppingCartTotalManager(models.Manager):
+    """Инкрементальное обновление сводной корзины покупок."""
+
+    def _increase(self, user_ids, deltas):
+        # INSERT ... ON CONFLICT DO UPDATE атомарно создаёт или
+        # увеличивает запись, поэтому параллельные добавления в корзину
+        # не конфликтуют на уникальном ограничении.
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        user, ingredient, total = (
+            quote_name(self.model._meta.get_field(name).column)
+            for name in ("user", "ingredient", "total_amount")
+        )
+        rows = sorted(
+            (user_id, ingredient_id, delta)
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items()
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), SHOPPING_CART_UPSERT_BATCH_SIZE):
+                batch = rows[start:start + SHOPPING_CART_UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    f"INSERT INTO {table} ({user}, {ingredient}, {total}) "
+                    f"VALUES {', '.join(['(%s, %s, %s)'] * len(batch))} "
+                    f"ON CONFLICT ({user}, {ingredient}) DO UPDATE "
+                    f"SET {total} = {table}.{total} + EXCLUDED.{total}",
+                    list(chain.from_iterable(batch)),
+                )
+
+    def _decrease(self, user_ids, deltas):
+        totals = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        totals.update(
+            total_amount=Greatest(
+                F("total_amount")
+                + Case(
+                    *(
+                        When(ingredient_id=ingredient_id, then=Value(delta))
+                        for ingredient_id, delta in deltas.items()
+                    ),
+                    output_field=models.IntegerField(),
+                ),
+                Value(0),
+            )
+        )
+        totals.filter(total_amount=0).delete()
+
+    def apply_deltas(self, user_ids, deltas):
+        """Изменяет количество продуктов в корзинах пользователей.
+
+        deltas - словарь {ingredient_id: изменение количества},
+        применяемый к корзине каждого из пользователей user_ids.
+        Записи, количество в которых стало нулевым, удаляются.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        increases = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items()
+            if delta > 0
+        }
+        decreases = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items()
+            if delta < 0
+        }
+        with transaction.atomic(using=self.db):
+            if increases:
+                self._increase(user_ids, increases)
+            if decreases:
+                self._decrease(user_ids, decreases)
+
+    def refresh(self, user_ids):
+        """Пересчитывает сводные корзины пользователей по их корзинам."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        live_totals = (
+            RecipeIngredient.objects.filter(
+                recipe__shoppingcarts__user_id__in=user_ids
+            )
+            .values_list("recipe__shoppingcarts__user_id", "ingredient_id")
+            .annotate(total_amount=Sum("amount"))
+            .order_by()
+        )
+        with transaction.atomic(using=self.db):
+            self.filter(user_id__in=user_ids).delete()
+            self.bulk_create(
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total_amount,
+                )
+                for user_id, ingredient_id, total_amount in live_totals
+            )
+
+    def add_recipe(self, recipe, user_ids, sign=1):
+        """Добавляет продукты рецепта в корзины пользователей."""
+        amounts = recipe.recipe_ingredients.values_list(
+            "ingredient_id", "amount"
+        )
+        self.apply_deltas(
+            user_ids,
+            {
+                ingredient_id: sign * amount
+                for ingredient_id, amount in amounts
+            },
+        )
+
+    def remove_recipe(self, recipe, user_ids):
+        """Убирает продукты рецепта из корзин пользователей."""
+        self.add_recipe(recipe, user_ids, sign=-1)
+
+
+class ShoppingCartTotal(models.Model):
+    """Сводное количество продуктов в корзине покупок."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+        related_name="shopping_cart_totals",
+        db_index=False,
+    )
+
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name="Продукт",
+        related_name="shopping_cart_totals",
+    )
+
+    total_amount = models.PositiveIntegerField(verbose_name="Количество")
+
+    objects = ShoppingCartTotalManager()
+
+    class Meta:
+        verbose_name = "Продукт в корзине"
+        verbose_name_plural = "Продукты в корзинах"
+        ordering = ("user", "ingredient")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_cart_total",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.ingredient} - {self.total_amount}"
+
+
+class PendingFileDeletionManager(models.Manager):
+    """Очередь файлов медиахранилища на удаление."""
+
+    def queue(self, names):
+        """Добавляет файлы в очередь, пропуская уже добавленные."""
+        self.bulk_create(
+            [self.model(name=name) for name in names if name],
+            ignore_conflicts=True,
+        )
+
+    def queue_on_commit(self, *names):
+        """Ставит файлы в очередь после фиксации текущей транзакции."""
+        transaction.on_commit(lambda: self.queue(names))
+
+
+class PendingFileDeletion(models.Model):
+    """Файл, на который больше не ссылается запись в базе.
+
+    Файлы удаляет команда reap_pending_files после повторной проверки
+    ссылок.
+    """
+
+    name = models.CharField(
+        verbose_name="Путь к файлу",
+        max_length=PENDING_FILE_DELETION_MAX_LENGTH,
+        unique=True,
+    )
+
+    created_at = models.DateTimeField(
+        verbose_name="Дата добавления",
+        auto_now_add=True,
+    )
+
+    objects = PendingFileDeletionManager()
+
+    class Meta:
+        verbose_name = "Файл на удаление"
+        verbose_name_plural = "Файлы на удаление"
+        ordering = ("id",)
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeScoreManager(models.Manager):
+    """Пересчёт рейтинга популярных рецептов."""
+
+    def _bucket_scores(self, model, weight, now):
+        """Возвращает вклад добавлений model в рейтинг рецептов.
+
+        Добавления группируются по часам, вес каждого часа убывает вдвое
+        за TRENDING_HALF_LIFE_HOURS. Записи без даты добавления, созданные
+        до появления поля, не учитываются.
+        """
+        since = now - timedelta(days=TRENDING_WINDOW_DAYS)
+        buckets = (
+            model.objects.filter(created_at__gte=since)
+            .annotate(hour=TruncHour("created_at"))
+            .order_by()
+            .values("recipe_id", "hour")
+            .annotate(added=Count("pk"))
+            .values_list("recipe_id", "hour", "added")
+        )
+        for recipe_id, hour, added in buckets.iterator():
+            age_hours = (now - hour).total_seconds() / 3600
+            yield recipe_id, (
+                weight * added * 0.5 ** (age_hours / TRENDING_HALF_LIFE_HOURS)
+            )
+
+    def rebuild(self, batch_size=1000):
+        """Пересчитывает рейтинг и заменяет им содержимое таблицы.
+
+        Возвращает количество рецептов в рейтинге.
+        """
+        now = timezone.now()
+        scores = defaultdict(float)
+        for model, weight in (
+            (Favorite, TRENDING_FAVORITE_WEIGHT),
+            (ShoppingCart, TRENDING_SHOPPING_CART_WEIGHT),
+        ):
+            for recipe_id, score in self._bucket_scores(model, weight, now):
+                scores[recipe_id] += score
+
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        recipe_id=recipe_id, score=score, computed_at=now
+                    )
+                    for recipe_id, score in scores.items()
+                ),
+                batch_size=batch_size,
+            )
+        return len(scores)
+
+
+class RecipeScore(models.Model):
+    """Рейтинг рецепта в ленте популярного."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="Рецепт",
+        related_name="score",
+    )
+
+    score = models.FloatField(verbose_name="Рейтинг")
+
+    computed_at = models.DateTimeField(verbose_name="Дата расчёта")
+
+    objects = RecipeScoreManager()
+
+    class Meta:
+        verbose_name = "Рейтинг рецепта"
+        verbose_name_plural = "Рейтинги рецептов"
+        ordering = ("-score",)
+        indexes = [
+            models.Index(
+                fields=["-score", "-recipe"], name="recipe_score_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.score:.3f}"
+
+
+class FeedEntry(models.Model):
+    """Рецепт во входящей ленте подписчика автора."""
+
+    follower = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Подписчик",
+        related_name="feed_entries",
+        db_index=False,
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+        related_name="feed_entries",
+    )
+
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Автор",
+        related_name="+",
+        db_index=False,
+    )
+
+    created_at = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи лент"
+        ordering = ("-created_at", "-recipe")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["follower", "recipe"], name="unique_feed_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["follower", "-created_at", "-recipe"],
+                name="feed_follower_created_idx",
+            ),
+            # Начинается с автора: по нему же удаляются записи каскадом
+            # при удалении пользователя.
+            models.Index(
+                fields=["author", "follower"],
+                name="feed_author_follower_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.follower_id} <- {self.recipe_id}"
@@ -0,0 +1,81 @@
+import threading
+from bisect import bisect_left
+from time import monotonic
+
+from constants import INGREDIENT_INDEX_TTL
+from .models import Ingredient
+
+
+class IngredientPrefixIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Хранит ингредиенты, отсортированные по названию в нижнем регистре,
+    и находит совпадения по префиксу двоичным поиском. Индекс
+    перестраивается при изменении ингредиентов в этом процессе и по
+    истечении INGREDIENT_INDEX_TTL секунд - для остальных воркеров.
+    """
+
+    def __init__(self, ttl=INGREDIENT_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = ([], [])
+        self._loaded_at = None
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _is_stale(self):
+        return (
+            self._loaded_at is None
+            or monotonic() - self._loaded_at > self.ttl
+        )
+
+    def _load(self):
+        with self._lock:
+            if not self._is_stale():
+                return
+            ingredients = sorted(
+                Ingredient.objects.only("id", "name", "measurement_unit"),
+                key=lambda ingredient: ingredient.name.lower(),
+            )
+            self._entries = (
+                [ingredient.name.lower() for ingredient in ingredients],
+                ingredients,
+            )
+            self._loaded_at = monotonic()
+
+    def startswith(self, prefix, limit=None):
+        """Возвращает ингредиенты, название которых начинается с prefix."""
+        if self._is_stale():
+            self._load()
+        keys, ingredients = self._entries
+        prefix = prefix.lower()
+        result = []
+        index = bisect_left(keys, prefix)
+        while index < len(keys) and keys[index].startswith(prefix):
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(ingredients[index])
+            index += 1
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
+
+
+def search_ingredients(query, limit=None):
+    """Совпадения по префиксу из индекса, затем по подстроке из БД.
+
+    Поиск по подстроке в PostgreSQL обслуживает триграммный индекс
+    recipes_ingredient_name_trgm.
+    """
+    result = ingredient_index.startswith(query, limit)
+    if limit is not None and len(result) >= limit:
+        return result
+
+    substring_matches = Ingredient.objects.filter(
+        name__icontains=query
+    ).exclude(name__istartswith=query)
+    if limit is not None:
+        substring_matches = substring_matches[:limit - len(result)]
+    return result + list(substring_matches)
@@ -1,26 +1,125 @@
-import os
-
-from django.conf import settings
-from django.db.models.signals import pre_save
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import User
+from .models import (
+    Favorite,
+    Ingredient,
+    PendingFileDeletion,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartTotal,
+)
+from .search import ingredient_index
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingCart)
+def stamp_created_at(sender, instance, **kwargs):
+    """Проставляет дату добавления в избранное или корзину."""
+    if instance.created_at is None:
+        instance.created_at = timezone.now()
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
 
-from .models import Recipe
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_cart_totals(sender, instance, **kwargs):
+    """Убирает продукты удаляемого рецепта из сводных корзин.
+
+    Срабатывает при любом удалении, в том числе из админки и каскадом
+    при удалении автора. Продукты рецепта к этому моменту ещё не удалены.
+    """
+    ShoppingCartTotal.objects.remove_recipe(
+        instance, instance.shoppingcarts.values_list("user_id", flat=True)
+    )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_cart_item_from_totals(sender, instance, origin=None, **kwargs):
+    """Убирает продукты рецепта из сводной корзины пользователя.
+
+    При удалении рецепта сводные корзины обновляет
+    remove_recipe_from_shopping_cart_totals, а при удалении пользователя
+    его сводная корзина удаляется каскадом. Строка корзины блокируется,
+    чтобы при одновременном удалении продукты не вычлись дважды.
+    """
+    if _origin_model(origin) in (Recipe, User):
+        return
+    locked = ShoppingCart.objects.select_for_update().filter(pk=instance.pk)
+    if not locked.values_list("pk", flat=True):
+        return
+    ShoppingCartTotal.objects.remove_recipe(
+        instance.recipe, [instance.user_id]
+    )
 
 
 @receiver(pre_save, sender=Recipe)
-def delete_old_image(sender, instance, **kwargs):
-    """Удаляет старое изображение рецепта при загрузке нового."""
-    if not instance.pk:
+def remember_old_image(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежнее изображение рецепта перед сохранением."""
+    if instance._state.adding:
+        return
+    if update_fields is not None and "image" not in update_fields:
         return
 
-    try:
-        old_instance = Recipe.objects.get(pk=instance.pk)
-        old_image = old_instance.image
-        new_image = instance.image
-
-        if old_image and old_image != new_image:
-            old_image_path = os.path.join(settings.MEDIA_ROOT, str(old_image))
-            if os.path.isfile(old_image_path):
-                os.remove(old_image_path)
-    except Recipe.DoesNotExist:
-        pass
+    old_image = (
+        Recipe.objects.filter(pk=instance.pk)
+        .values_list("image", flat=True)
+        .first()
+    )
+    if old_image and old_image != instance.image.name:
+        instance._old_image = old_image
+
+
+@receiver(post_save, sender=Recipe)
+def delete_old_image(sender, instance, **kwargs):
+    """Ставит прежнее изображение рецепта в очередь на удаление.
+
+    Файл может быть общим для нескольких рецептов, поэтому его удаляет
+    команда reap_pending_files после проверки ссылок.
+    """
+    old_image = instance.__dict__.pop("_old_image", None)
+    if old_image:
+        PendingFileDeletion.objects.queue_on_commit(old_image)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image(sender, instance, **kwargs):
+    """Ставит изображение удалённого рецепта и его копии в очередь."""
+    if instance.image:
+        PendingFileDeletion.objects.queue_on_commit(
+            instance.image.name, *instance.image_variants.values()
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс автодополнения при изменении ингредиентов."""
+    ingredient_index.invalidate()
+
+
+@receiver(post_migrate)
+def create_ingredient_trigram_index(sender, using, **kwargs):
+    """Создаёт триграммный индекс для поиска ингредиентов по подстроке."""
+    connection = connections[using]
+    if sender.label != "recipes" or connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm "
+            f"ON {Ingredient._meta.db_table} "
+            'USING gin (UPPER("name"::text) gin_trgm_ops)'
+        )
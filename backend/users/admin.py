@@ -13,6 +13,8 @@ class UserAdmin(UserAdmin):
         "email",
         "first_name",
         "last_name",
+        "recipes_count",
+        "followers_count",
         "is_staff_display",
         "is_superuser_display",
     )
@@ -1,8 +1,14 @@
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from time import monotonic
 
+import django
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 
 Account = get_user_model()
@@ -11,33 +17,100 @@ Account = get_user_model()
 class Command(BaseCommand):
     help = "Импорт данных пользователей из JSON-файла"
 
-    def handle(self, *args, **kwargs):
-        users_data_path = os.path.join("data", "users.json")
-
-        with open(users_data_path, "r", encoding="utf-8") as json_file:
-            user_records = json.load(json_file)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=os.path.join("data", "users.json"),
+            help="Путь к JSON-файлу с пользователями",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество пользователей в одном INSERT",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Количество процессов для хеширования паролей",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только захешировать пароли и замерить скорость",
+        )
 
+    def _new_records(self, user_records):
+        usernames = set(Account.objects.values_list("username", flat=True))
+        emails = set(Account.objects.values_list("email", flat=True))
         for account_info in user_records:
-            if Account.objects.filter(
-                username=account_info["username"]
-            ).exists():
+            if (
+                account_info["username"] in usernames
+                or account_info["email"] in emails
+            ):
                 self.stdout.write(
                     f'Аккаунт с именем "{account_info["username"]}"'
                     " уже зарегистрирован"
                 )
                 continue
+            usernames.add(account_info["username"])
+            emails.add(account_info["email"])
+            yield account_info
 
-            new_account = Account.objects.create_user(
-                username=account_info["username"],
-                email=account_info["email"],
-                first_name=account_info["first_name"],
-                last_name=account_info["last_name"],
-                password=account_info["password"],
-            )
+    def handle(self, *args, **options):
+        with open(options["path"], "r", encoding="utf-8") as json_file:
+            user_records = json.load(json_file)
+
+        batch_size = options["batch_size"]
+        records = self._new_records(user_records)
+        started_at = monotonic()
+        created_count = 0
 
+        with ProcessPoolExecutor(
+            max_workers=options["workers"], initializer=django.setup
+        ) as executor:
+            while batch := list(islice(records, batch_size)):
+                passwords = executor.map(
+                    make_password,
+                    (account_info["password"] for account_info in batch),
+                    chunksize=max(len(batch) // options["workers"], 1),
+                )
+                accounts = [
+                    Account(
+                        username=Account.normalize_username(
+                            account_info["username"]
+                        ),
+                        email=Account.objects.normalize_email(
+                            account_info["email"]
+                        ),
+                        first_name=account_info["first_name"],
+                        last_name=account_info["last_name"],
+                        password=password,
+                    )
+                    for account_info, password in zip(batch, passwords)
+                ]
+                if not options["dry_run"]:
+                    with transaction.atomic():
+                        Account.objects.bulk_create(accounts)
+                created_count += len(accounts)
+
+        elapsed = monotonic() - started_at
+        rate = created_count / max(elapsed, 1e-6)
+        if options["dry_run"]:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f"Добавлен пользователь: {new_account.username} "
-                    f"({new_account.first_name} {new_account.last_name})"
+                    f"Пробный запуск: подготовлено {created_count} "
+                    f"пользователей за {elapsed:.2f} с "
+                    f"({rate:.0f} пользователей/с), в базу ничего "
+                    "не записано."
                 )
             )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Добавлено пользователей: {created_count} "
+                f"за {elapsed:.2f} с ({rate:.0f} пользователей/с)."
+            )
+        )
@@ -1,20 +1,14 @@
-import os
-import shutil
-
-from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from users.models import User
+from users.signals import get_default_avatar_path, store_default_avatar
 
 
 class Command(BaseCommand):
     help = "Устанавливает аватары по умолчанию"
 
     def handle(self, *args, **options):
-        avatar_dir = os.path.join(settings.MEDIA_ROOT, "avatars")
-        os.makedirs(avatar_dir, exist_ok=True)
-
-        users = User.objects.all()
+        users = User.objects.only("id", "username", "avatar")
         total_users = users.count()
 
         self.stdout.write(
@@ -22,40 +16,30 @@ class Command(BaseCommand):
             f"{total_users} пользователей..."
         )
 
-        for user in users:
-            avatar_number = user.id % 6 + 1
-
-            for ext in [".png", ".jpg"]:
-                default_avatar_path = os.path.join(
-                    settings.BASE_DIR,
-                    "data",
-                    "images",
-                    "test-images",
-                    f"face{avatar_number}{ext}",
-                )
-
-                if os.path.exists(default_avatar_path):
-                    new_avatar_path = os.path.join(
-                        avatar_dir, f"user_{user.id}_avatar{ext}"
-                    )
-                    shutil.copy2(default_avatar_path, new_avatar_path)
-
-                    user.avatar = f"avatars/user_{user.id}_avatar{ext}"
-                    user.save(update_fields=["avatar"])
-
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f"Установлен аватар для пользователя "
-                            f"{user.username}"
-                        )
-                    )
-                    break
-            else:
+        stored_avatars = {}
+        updated_users = []
+        for user in users.iterator():
+            avatar_path = get_default_avatar_path(user.id)
+            if avatar_path is None:
                 self.stdout.write(
                     self.style.WARNING(
                         f"Не найден файл аватара для пользователя "
                         f"{user.username}"
                     )
                 )
+                continue
+
+            if avatar_path not in stored_avatars:
+                stored_avatars[avatar_path] = store_default_avatar(
+                    avatar_path
+                )
+            user.avatar = stored_avatars[avatar_path]
+            updated_users.append(user)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Установлен аватар для пользователя {user.username}"
+                )
+            )
 
+        User.objects.bulk_update(updated_users, ["avatar"], batch_size=1000)
         self.stdout.write(self.style.SUCCESS("Установка аватаров завершена"))
@@ -9,6 +9,8 @@ from constants import (
     USERNAME_MAX_LENGTH,
     USERNAME_REGEX_VALIDATOR,
 )
+from foodgram.managers import InsertIgnoreManager
+from foodgram.storage import content_addressed_storage
 
 
 class User(AbstractUser):
@@ -49,8 +51,18 @@ class User(AbstractUser):
     avatar = models.ImageField(
         verbose_name="Аватар",
         upload_to="avatars/",
+        storage=content_addressed_storage,
         blank=True,
         null=True,
+        db_index=True,
+    )
+
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Рецептов", default=0, editable=False
+    )
+
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Подписчиков", default=0, editable=False
     )
 
     class Meta:
@@ -70,6 +82,7 @@ class Subscription(models.Model):
         on_delete=models.CASCADE,
         related_name="follower",
         verbose_name="Пользователь",
+        db_index=False,
     )
 
     author = models.ForeignKey(
@@ -77,8 +90,11 @@ class Subscription(models.Model):
         on_delete=models.CASCADE,
         related_name="author",
         verbose_name="Автор",
+        db_index=False,
     )
 
+    objects = InsertIgnoreManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -89,6 +105,12 @@ class Subscription(models.Model):
                 name="prevent_self_subscription",
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "follower"],
+                name="subscription_author_idx",
+            ),
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
         ordering = ("follower",)
@@ -1,55 +1,83 @@
 import os
 
 from django.conf import settings
-from django.db.models.signals import post_save, pre_save
+from django.core.files import File
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from recipes.models import PendingFileDeletion
 from .models import User
 
+DEFAULT_AVATARS_DIR = os.path.join(
+    settings.BASE_DIR, "data", "images", "test-images"
+)
+
+
+def get_default_avatar_path(user_id):
+    """Возвращает путь к аватару по умолчанию для пользователя."""
+    for extension in (".png", ".jpg"):
+        avatar_path = os.path.join(
+            DEFAULT_AVATARS_DIR, f"face{user_id % 6 + 1}{extension}"
+        )
+        if os.path.exists(avatar_path):
+            return avatar_path
+    return None
+
+
+def store_default_avatar(avatar_path):
+    """Сохраняет аватар по умолчанию в хранилище и возвращает его имя.
+
+    Хранилище адресует файлы по содержимому, поэтому каждый аватар
+    по умолчанию хранится в одном экземпляре для всех пользователей.
+    """
+    with open(avatar_path, "rb") as avatar_file:
+        return User.avatar.field.storage.save(
+            User.avatar.field.generate_filename(
+                None, os.path.basename(avatar_path)
+            ),
+            File(avatar_file),
+        )
+
 
 @receiver(pre_save, sender=User)
-def delete_old_avatar(sender, instance, **kwargs):
-    """Удаляет старый аватар при загрузке нового."""
-    if not instance.pk:
+def remember_old_avatar(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежний аватар пользователя перед сохранением."""
+    if instance._state.adding:
+        return
+    if update_fields is not None and "avatar" not in update_fields:
         return
 
-    try:
-        old_instance = User.objects.get(pk=instance.pk)
-        old_avatar = old_instance.avatar
-        new_avatar = instance.avatar
-
-        if old_avatar and old_avatar != new_avatar:
-            old_avatar_path = os.path.join(
-                settings.MEDIA_ROOT, str(old_avatar)
-            )
-            if os.path.isfile(old_avatar_path):
-                os.remove(old_avatar_path)
-    except User.DoesNotExist:
-        pass
+    old_avatar = (
+        User.objects.filter(pk=instance.pk)
+        .values_list("avatar", flat=True)
+        .first()
+    )
+    if old_avatar and old_avatar != instance.avatar.name:
+        instance._old_avatar = old_avatar
 
 
 @receiver(post_save, sender=User)
-def set_default_avatar(sender, instance, created, **kwargs):
-    """Устанавливает аватар для админа."""
-    if created and not instance.avatar:
-        default_avatar_path = os.path.join(
-            settings.BASE_DIR,
-            "data",
-            "images",
-            "test-images",
-            f"face{instance.id % 6 + 1}.png",
-        )
+def delete_old_avatar(sender, instance, **kwargs):
+    """Ставит прежний аватар в очередь на удаление."""
+    old_avatar = instance.__dict__.pop("_old_avatar", None)
+    if old_avatar:
+        PendingFileDeletion.objects.queue_on_commit(old_avatar)
 
-        if os.path.exists(default_avatar_path):
-            avatar_dir = os.path.join(settings.MEDIA_ROOT, "avatars")
-            os.makedirs(avatar_dir, exist_ok=True)
 
-            import shutil
+@receiver(post_delete, sender=User)
+def delete_user_avatar(sender, instance, **kwargs):
+    """Ставит аватар удалённого пользователя в очередь на удаление."""
+    if instance.avatar:
+        PendingFileDeletion.objects.queue_on_commit(instance.avatar.name)
 
-            new_avatar_path = os.path.join(
-                avatar_dir, f"user_{instance.id}_avatar.png"
-            )
-            shutil.copy2(default_avatar_path, new_avatar_path)
 
-            instance.avatar = f"avatars/user_{instance.id}_avatar.png"
-            instance.save(update_fields=["avatar"])
+@receiver(post_save, sender=User)
+def set_default_avatar(sender, instance, created, **kwargs):
+    """Устанавливает аватар по умолчанию новому пользователю."""
+    if not created or instance.avatar:
+        return
+
+    avatar_path = get_default_avatar_path(instance.id)
+    if avatar_path:
+        instance.avatar = store_default_avatar(avatar_path)
+        instance.save(update_fields=["avatar"])